@@ -2,6 +2,7 @@ from __future__ import annotations
 import os
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
+from sqlalchemy.engine import make_url
 from alembic import context
 
 config = context.config
@@ -19,7 +20,11 @@ def get_url() -> str:
     # Prefer a single DATABASE_URL if provided
     url = os.getenv("DATABASE_URL")
     if url:
-        return url
+        # Drop the app-side `pgbouncer` marker; libpq rejects unknown params.
+        # (Point migrations at Postgres directly, not a transaction pooler.)
+        return make_url(url).difference_update_query(["pgbouncer"]).render_as_string(
+            hide_password=False
+        )
 
     # Else, assemble from POSTGRES_* (all come from your .env via compose)
     user = os.getenv("POSTGRES_USER")
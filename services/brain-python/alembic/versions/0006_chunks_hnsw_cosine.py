@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0006_chunks_hnsw_cosine"
+down_revision = "0005_fix_vector_dimension_384"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 0005 recreated `chunks`, which dropped the HNSW index from 0002.
+    # Rebuild it with cosine ops (embeddings are unit-normalized) and
+    # tuned graph params. CONCURRENTLY can't run inside a transaction, so
+    # build outside the migration tx; the table stays writable meanwhile.
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_chunks_embedding_hnsw")
+        # Session-level settings: reset even if the build fails, so they
+        # don't leak into whatever runs next on this connection.
+        op.execute("SET maintenance_work_mem = '2GB'")
+        op.execute("SET max_parallel_maintenance_workers = 7")
+        try:
+            op.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding_hnsw
+                ON chunks USING hnsw (embedding vector_cosine_ops)
+                WITH (m = 24, ef_construction = 128)
+            """)
+        finally:
+            op.execute("RESET maintenance_work_mem")
+            op.execute("RESET max_parallel_maintenance_workers")
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_chunks_embedding_hnsw")
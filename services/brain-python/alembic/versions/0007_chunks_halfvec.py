@@ -0,0 +1,44 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0007_chunks_halfvec"
+down_revision = "0006_chunks_hnsw_cosine"
+branch_labels = None
+depends_on = None
+
+def _build_hnsw(opclass: str):
+    # CONCURRENTLY can't run inside a transaction: commit the column change
+    # first, then build with parallel workers while the table stays writable.
+    with op.get_context().autocommit_block():
+        op.execute("SET maintenance_work_mem = '2GB'")
+        op.execute("SET max_parallel_maintenance_workers = 7")
+        # Session-level settings: reset even if the build fails.
+        try:
+            op.execute(f"""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding_hnsw
+                ON chunks USING hnsw (embedding {opclass})
+                WITH (m = 24, ef_construction = 128)
+            """)
+        finally:
+            op.execute("RESET maintenance_work_mem")
+            op.execute("RESET max_parallel_maintenance_workers")
+
+def upgrade():
+    # Store embeddings as FP16 (halfvec, pgvector >= 0.7): half the bytes per
+    # row and per HNSW node, negligible recall loss at 384 dims.
+    # The index opclass is type-specific, so drop it before altering the column.
+    op.execute("DROP INDEX IF EXISTS idx_chunks_embedding_hnsw")
+    op.execute("""
+        ALTER TABLE chunks
+        ALTER COLUMN embedding TYPE halfvec(384) USING embedding::halfvec(384)
+    """)
+    _build_hnsw("halfvec_cosine_ops")
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_chunks_embedding_hnsw")
+    op.execute("""
+        ALTER TABLE chunks
+        ALTER COLUMN embedding TYPE vector(384) USING embedding::vector(384)
+    """)
+    _build_hnsw("vector_cosine_ops")
@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008_covering_indexes"
+down_revision = "0007_chunks_halfvec"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # Replaces ix_chunks_file_id (lost when 0005 recreated chunks) and lets
+        # per-file lookups / EXISTS probes on chunks run as index-only scans.
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_file_id_cover
+            ON chunks (file_id) INCLUDE (start_line, end_line)
+        """)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_file_id_cover")
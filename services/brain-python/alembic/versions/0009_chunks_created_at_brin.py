@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009_chunks_created_at_brin"
+down_revision = "0008_covering_indexes"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # chunks are append-only, so created_at tracks physical order and a BRIN
+    # index stays a few pages in size while still pruning "recent N" scans.
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_created_at_brin
+            ON chunks USING brin (created_at)
+        """)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_created_at_brin")
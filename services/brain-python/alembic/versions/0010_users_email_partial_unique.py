@@ -0,0 +1,51 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0010_users_email_partial_unique"
+down_revision = "0009_chunks_created_at_brin"
+branch_labels = None
+depends_on = None
+
+# 0003 skips uq_users_email when a unique index/constraint of this name already
+# exists; left in place it would keep enforcing the full unique index.
+_LEGACY = "ix_users_email_unique"
+# Set on the new index when it replaced _LEGACY, so downgrade restores that name.
+_REPLACES_LEGACY = f"replaces {_LEGACY}"
+
+def upgrade():
+    # email is nullable: leave NULL rows out of the unique index so it only
+    # holds real addresses. `email = :x` implies NOT NULL, so lookups in
+    # auth.py still use it. Build the replacement first, then swap names.
+    bind = op.get_bind()
+    legacy = bind.execute(
+        sa.text("SELECT to_regclass(:name) IS NOT NULL"), {"name": _LEGACY}
+    ).scalar()
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_users_email_partial
+            ON users (email) WHERE email IS NOT NULL
+        """)
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_users_email")
+        if legacy:
+            # It may back a constraint, which DROP INDEX refuses to drop.
+            op.execute(f"ALTER TABLE users DROP CONSTRAINT IF EXISTS {_LEGACY}")
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {_LEGACY}")
+    op.execute("ALTER INDEX uq_users_email_partial RENAME TO uq_users_email")
+    if legacy:
+        op.execute(f"COMMENT ON INDEX uq_users_email IS '{_REPLACES_LEGACY}'")
+
+def downgrade():
+    bind = op.get_bind()
+    replaced_legacy = bind.execute(
+        sa.text("SELECT obj_description(to_regclass('uq_users_email'), 'pg_class') = :note"),
+        {"note": _REPLACES_LEGACY},
+    ).scalar()
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_users_email_full
+            ON users (email)
+        """)
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_users_email")
+    name = _LEGACY if replaced_legacy else "uq_users_email"
+    op.execute(f"ALTER INDEX uq_users_email_full RENAME TO {name}")
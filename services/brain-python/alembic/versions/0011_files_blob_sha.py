@@ -0,0 +1,24 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0011_files_blob_sha"
+down_revision = "0010_users_email_partial_unique"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Git blob SHA the file's chunks were built from. Identical blobs (vendored
+    # or copied files, forks) chunk and embed identically, so a new file can
+    # copy the chunks of any file with the same blob_sha instead of embedding.
+    op.add_column("files", sa.Column("blob_sha", sa.Text(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_blob_sha
+            ON files (blob_sha) WHERE blob_sha IS NOT NULL
+        """)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_files_blob_sha")
+    op.drop_column("files", "blob_sha")
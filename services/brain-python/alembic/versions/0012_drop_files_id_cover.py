@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0012_drop_files_id_cover"
+down_revision = "0011_files_blob_sha"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Databases that ran an earlier 0008 have a second unique index on
+    # files.id next to the primary key; KNN joins only k rows by id, so it
+    # saved next to nothing and cost every files upsert.
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_files_id_cover")
+
+def downgrade():
+    pass
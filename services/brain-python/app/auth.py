@@ -1,22 +1,44 @@
 from datetime import datetime, timedelta, timezone
-import os, jwt
+from functools import lru_cache
+import os, time, jwt
 from fastapi import APIRouter, Depends, HTTPException, Header
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
-from passlib.hash import bcrypt
+from passlib.context import CryptContext
 from .db import get_db, User
 
 router = APIRouter(tags=["auth"])
 
+# argon2id with the OWASP profile for new hashes; bcrypt kept so existing
+# hashes still verify and get upgraded on next login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+)
+
 def _jwt_secret() -> str:
     return os.getenv("AUTH_JWT_SECRET") or "dev-secret-change-me"
 
+_JWT_ALG = "HS256"
+
+@lru_cache(maxsize=1)
+def _jwt_key() -> bytes:
+    # Read + encode the HMAC secret once instead of on every sign/verify.
+    return _jwt_secret().encode()
+
 def _jwt_exp_seconds() -> int:
     try:
         return int(os.getenv("AUTH_JWT_EXPIRES_SECONDS", "3600"))
     except ValueError:
         return 3600
 
+# Built once so SQLAlchemy's compiled-statement cache is hit on every request.
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+
 class SignUpReq(BaseModel):
     first_name: str = Field(min_length=1, max_length=120)
     last_name: str = Field(min_length=1, max_length=120)
@@ -43,20 +65,24 @@ def _create_token(user_id: int, email: str | None) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(seconds=_jwt_exp_seconds())
     payload = {"sub": str(user_id), "email": email, "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
-    return jwt.encode(payload, _jwt_secret(), algorithm="HS256")
+    return jwt.encode(payload, _jwt_key(), algorithm=_JWT_ALG)
 
 @router.post("/auth/signup", response_model=UserOut)
 def signup(body: SignUpReq, db: Session = Depends(get_db)):
     if body.password != body.confirm_password:
         raise HTTPException(400, "passwords do not match")
-    existing = db.query(User).filter(User.email == body.email).first()
+    existing = db.scalar(_USER_BY_EMAIL, {"email": body.email})
     if existing:
         raise HTTPException(409, "email already registered")
+    # Sync route => already runs in FastAPI's threadpool, off the event loop.
+    # End the read tx first so the pooled DB connection isn't held while hashing.
+    db.rollback()
+    password_hash = pwd_context.hash(body.password)
     user = User(
         first_name=body.first_name,
         last_name=body.last_name,
         email=body.email,
-        password_hash=bcrypt.hash(body.password),
+        password_hash=password_hash,
         phone=body.phone,
         address=body.address,
     )
@@ -65,17 +91,36 @@ def signup(body: SignUpReq, db: Session = Depends(get_db)):
 
 @router.post("/auth/login")
 def login(body: LoginReq, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == body.email).first()
-    if not user or not bcrypt.verify(body.password, user.password_hash or ""):
+    user = db.scalar(_USER_BY_EMAIL, {"email": body.email})
+    if not user or not user.password_hash:
         raise HTTPException(status_code=401, detail="invalid credentials")
+    # Detach (keeps loaded fields) and release the DB connection during the hash.
+    db.expunge(user)
+    db.rollback()
+    ok, new_hash = pwd_context.verify_and_update(body.password, user.password_hash)
+    if not ok:
+        raise HTTPException(status_code=401, detail="invalid credentials")
+    if new_hash:
+        user.password_hash = new_hash
+        db.add(user)
+        db.commit()
     token = _create_token(user.id, user.email)
     return {"token": token, "user": UserOut.model_validate(user).model_dump()}
 
-def _decode(token: str) -> dict:
+@lru_cache(maxsize=4096)
+def _decode_verified(token: str) -> dict:
+    # Only successful decodes are cached; failures raise and are retried.
+    return jwt.decode(token, _jwt_key(), algorithms=[_JWT_ALG])
+
+def _decode_cached(token: str) -> dict:
+    """Decode and verify a JWT, skipping the signature check for tokens seen before."""
     try:
-        return jwt.decode(token, _jwt_secret(), algorithms=["HS256"])
+        payload = _decode_verified(token)
     except jwt.PyJWTError:
         raise HTTPException(401, "invalid or expired token")
+    if payload.get("exp", 0) <= time.time():
+        raise HTTPException(401, "invalid or expired token")
+    return payload
 
 @router.get("/me", response_model=UserOut)
 def me(
@@ -84,7 +129,7 @@ def me(
 ):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "missing token")
-    payload = _decode(authorization.split(" ", 1)[1])
+    payload = _decode_cached(authorization.split(" ", 1)[1])
     user = db.get(User, int(payload["sub"]))
     if not user:
         raise HTTPException(404, "user not found")
@@ -1,19 +1,98 @@
+from collections import OrderedDict
+
 import httpx
+import orjson
 
 GITHUB_API = "https://api.github.com"
+GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
+
+# One pooled HTTP/2 client for all GitHub calls (keep-alive, no per-call TLS handshake).
+_client = httpx.AsyncClient(
+    base_url=GITHUB_API,
+    http2=True,
+    timeout=20,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    headers={"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"},
+)
+
+async def aclose():
+    await _client.aclose()
 
 async def gh_get(repo_token: str, url: str):
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(
-            url if url.startswith("http") else f"{GITHUB_API}{url}",
-            headers={"Authorization": f"Bearer {repo_token}",
-                     "Accept": "application/vnd.github+json"}
-        )
-        r.raise_for_status()
-        return r.json()
+    # `url` is relative to GITHUB_API, e.g. "/repositories/123"
+    r = await _client.get(url, headers={"Authorization": f"Bearer {repo_token}"})
+    r.raise_for_status()
+    # Tree responses run to MBs; orjson parses the raw bytes directly.
+    return orjson.loads(r.content)
+
+async def gh_get_raw(repo_token: str, url: str) -> bytes:
+    """Raw body of a blob/contents URL: GitHub skips the base64 + JSON envelope."""
+    r = await _client.get(
+        url,
+        headers={
+            "Authorization": f"Bearer {repo_token}",
+            "Accept": "application/vnd.github.raw+json",
+        },
+    )
+    r.raise_for_status()
+    return r.content
+
+async def exchange_oauth_code(client_id: str, client_secret: str, code: str, redirect_uri: str):
+    r = await _client.post(
+        GITHUB_TOKEN_URL,
+        data={
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "code": code,
+            "redirect_uri": redirect_uri,
+        },
+        headers={"Accept": "application/json"},
+    )
+    r.raise_for_status()
+    return orjson.loads(r.content)
+
+async def get_user(token: str):
+    return await gh_get(token, "/user")
+
+# ETag + body of the last response per cache key. A conditional request that
+# comes back 304 reuses the body and doesn't count against the rate limit.
+_ETAG_CACHE_MAX = 1024
+_etag_cache: OrderedDict[tuple, tuple[str, object]] = OrderedDict()
+
+async def _get_with_etag(key: tuple, token: str, url: str, params: dict | None = None):
+    headers = {"Authorization": f"Bearer {token}"}
+    cached = _etag_cache.get(key)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    r = await _client.get(url, params=params, headers=headers)
+    if r.status_code == 304 and cached:
+        _etag_cache.move_to_end(key)
+        return cached[1]
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    etag = r.headers.get("ETag")
+    if etag:
+        _etag_cache[key] = (etag, data)
+        _etag_cache.move_to_end(key)
+        if len(_etag_cache) > _ETAG_CACHE_MAX:
+            _etag_cache.popitem(last=False)
+    return data
+
+async def gh_get_conditional(repo_token: str, url: str):
+    """gh_get for small, frequently re-read resources (repo, branch). Don't mutate the result."""
+    # Keyed per token: GitHub varies ETags (and visibility) by Authorization.
+    return await _get_with_etag((repo_token, url), repo_token, url)
+
+async def list_user_repos(token: str, cache_key: int):
+    return await _get_with_etag(
+        ("user-repos", cache_key),
+        token,
+        "/user/repos",
+        params={"per_page": 100, "sort": "updated"},
+    )
 
 async def get_repo_info_by_id(token: str, repo_id: int):
-    data = await gh_get(token, f"/repositories/{repo_id}")
+    data = await gh_get_conditional(token, f"/repositories/{repo_id}")
     full_name = data["full_name"]  # "owner/name"
     owner, name = full_name.split("/", 1)
     default_branch = data["default_branch"]
@@ -23,11 +102,3 @@ async def get_repo_info_by_id(token: str, repo_id: int):
         "name": name,
         "default_branch": default_branch,
     }
-
-async def get_tree_paths(token: str, owner: str, name: str, default_branch: str):
-    # Need the head commit SHA to fetch the full recursive tree.
-    branch = await gh_get(token, f"/repos/{owner}/{name}/branches/{default_branch}")
-    head_sha = branch["commit"]["sha"]
-    tree = await gh_get(token, f"/repos/{owner}/{name}/git/trees/{head_sha}?recursive=1")
-    # Keep only 'blob' (files), ignore 'tree' (dirs) and submodules
-    return sorted([e["path"] for e in tree.get("tree", []) if e.get("type") == "blob"])
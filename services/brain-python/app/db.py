@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import os
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
+import numpy as np
 import sqlalchemy as sa
-from sqlalchemy import text
+from pgvector import HalfVector
+from pgvector.psycopg import register_vector
+from sqlalchemy import event, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import (
@@ -16,6 +20,31 @@ from sqlalchemy.orm import (
     sessionmaker,
 )
 
+__all__ = [
+    "EMBED_DIM",
+    "HNSW_EF_SEARCH",
+    "engine",
+    "SessionLocal",
+    "get_db",
+    "Base",
+    "User",
+    "GithubAccount",
+    "enc",
+    "dec",
+    "probe_db",
+    "schema_health",
+    "insert_chunk_with_vec",
+    "insert_chunks_bulk",
+    "insert_chunks_with_vecs",
+    "blob_shas_with_chunks",
+    "copy_blob_chunks",
+    "upsert_file_hashes",
+    "knn_paths_iter",
+    "knn_paths",
+    "knn_from_last",
+    "indexed_paths_for_repo_owner_name",
+]
+
 # --- Config ---------------------------------------------------------------
 
 def _resolve_db_url() -> str:
@@ -31,10 +60,54 @@ def _resolve_db_url() -> str:
         return f"postgresql+psycopg://{user}:{password}@{host}:{port}/{db}"
     raise RuntimeError("Missing DB env: set DATABASE_URL or POSTGRES_* vars")
 
-EMBED_DIM = int(os.environ["EMBED_DIM"])
+def _resolve_embed_dim() -> int:
+    raw = os.getenv("EMBED_DIM")
+    if not raw:
+        raise RuntimeError("Missing EMBED_DIM env")
+    try:
+        dim = int(raw)
+    except ValueError:
+        raise RuntimeError(f"EMBED_DIM must be an integer, got {raw!r}")
+    # Must match chunks.embedding; HNSW on halfvec indexes up to 4000 dims.
+    if not 1 <= dim <= 4000:
+        raise RuntimeError(f"EMBED_DIM must be in 1..4000, got {dim}")
+    return dim
+
+EMBED_DIM = _resolve_embed_dim()
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
+def _create_engine() -> Engine:
+    url = sa.engine.make_url(_resolve_db_url())
+    # psycopg server-side-prepares a query after `prepare_threshold` runs of the
+    # same text (default 5). The hot SQL here is fixed module-level text, so
+    # prepare on first use and skip parse/plan from the second call on.
+    connect_args = {"prepare_threshold": int(os.getenv("DB_PREPARE_THRESHOLD", "0"))}
+    # `?pgbouncer=true` marks a transaction-mode PgBouncer: server-side
+    # prepared statements don't survive across its backends, so turn them off.
+    if url.query.get("pgbouncer", "").lower() in ("1", "true", "yes"):
+        url = url.difference_update_query(["pgbouncer"])
+        connect_args["prepare_threshold"] = None
+    return sa.create_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "9")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "4")),
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args=connect_args,
+        future=True,
+    )
+
+engine: Engine = _create_engine()
+
+@event.listens_for(engine, "connect")
+def _register_pgvector(dbapi_conn, _record):
+    # Bind numpy arrays as pgvector values in binary wire format.
+    register_vector(dbapi_conn)
 
-engine: Engine = sa.create_engine(_resolve_db_url(), pool_pre_ping=True, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# expire_on_commit=False: objects stay readable after commit without a re-SELECT.
+SessionLocal = sessionmaker(
+    bind=engine, autoflush=False, autocommit=False, expire_on_commit=False, future=True
+)
 
 # Your auth.py expects this name:
 def get_db() -> Session:
@@ -114,90 +187,349 @@ def schema_health() -> dict:
     ok = bool(ext and all(t in tables for t in ("users", "repos", "files", "chunks")))
     return {"ok": ok, "vector_ext": bool(ext), "tables": tables}
 
+# --- SQL --------------------------------------------------------------------
+# Built once at import: SQLAlchemy caches the compiled form by statement and
+# psycopg sees identical query text, so neither re-parses per call.
+
+_UPSERT_REPO_SQL = text("""
+    INSERT INTO repos(owner, name, default_branch)
+    VALUES (:owner, :name, 'main')
+    ON CONFLICT (owner, name) DO UPDATE
+    SET default_branch = COALESCE(EXCLUDED.default_branch, repos.default_branch)
+    RETURNING id
+""")
+
+_UPSERT_FILE_SQL = text("""
+    INSERT INTO files(repo_id, path, commit, content_hash)
+    VALUES (:repo_id, :path, NULL, NULL)
+    ON CONFLICT (repo_id, path) DO UPDATE
+    SET commit = COALESCE(EXCLUDED.commit, files.commit),
+        content_hash = COALESCE(EXCLUDED.content_hash, files.content_hash),
+        blob_sha = NULL
+    RETURNING id
+""")
+
+# blob_sha and content_hash are set in the same statement that precedes the
+# chunk COPY, so they never describe chunks built from other content (NULL
+# when unknown).
+_UPSERT_FILES_BULK_SQL = text("""
+    INSERT INTO files(repo_id, path, commit, content_hash, blob_sha)
+    SELECT :repo_id, p.path, CAST(:commit AS text), p.content_hash, p.blob_sha
+    FROM unnest(CAST(:paths AS text[]), CAST(:blob_shas AS text[]), CAST(:hashes AS text[]))
+      AS p(path, blob_sha, content_hash)
+    ON CONFLICT (repo_id, path) DO UPDATE
+    SET commit = COALESCE(EXCLUDED.commit, files.commit),
+        content_hash = EXCLUDED.content_hash,
+        blob_sha = EXCLUDED.blob_sha
+    RETURNING path, id
+""")
+
+# Vector params arrive as typed binary halfvec (see _vec_param), so the SQL
+# needs no ::halfvec casts.
+
+# Single-chunk insert as one statement: repo upsert, file upsert and chunk
+# insert chained through CTEs, so a call is one round-trip (and, with
+# prepare_threshold=0, one cached plan) instead of three.
+_INSERT_CHUNK_SQL = text("""
+    WITH r AS (
+        INSERT INTO repos(owner, name, default_branch)
+        VALUES (:owner, :name, 'main')
+        ON CONFLICT (owner, name) DO UPDATE
+        SET default_branch = COALESCE(EXCLUDED.default_branch, repos.default_branch)
+        RETURNING id
+    ), f AS (
+        INSERT INTO files(repo_id, path, commit, content_hash)
+        SELECT r.id, :path, NULL, NULL FROM r
+        ON CONFLICT (repo_id, path) DO UPDATE
+        SET commit = COALESCE(EXCLUDED.commit, files.commit),
+            content_hash = COALESCE(EXCLUDED.content_hash, files.content_hash),
+            blob_sha = NULL
+        RETURNING id, repo_id
+    ), c AS (
+        INSERT INTO chunks(file_id, start_line, end_line, embedding)
+        SELECT f.id, :start, :end, :embedding FROM f
+        RETURNING id, file_id
+    )
+    SELECT f.repo_id, c.file_id, c.id AS chunk_id FROM c JOIN f ON f.id = c.file_id
+""")
+
+_COPY_CHUNKS_SQL = (
+    "COPY chunks(file_id, start_line, end_line, embedding) FROM STDIN (FORMAT BINARY)"
+)
+
+_DELETE_FILES_CHUNKS_SQL = text("DELETE FROM chunks WHERE file_id = ANY(:file_ids)")
+
+_BLOB_SHAS_WITH_CHUNKS_SQL = text("""
+    SELECT DISTINCT f.blob_sha
+    FROM files f
+    WHERE f.blob_sha = ANY(:shas)
+      AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
+""")
+
+_BLOB_SOURCE_SQL = text("""
+    SELECT f.id, f.content_hash
+    FROM files f
+    WHERE f.blob_sha = :blob_sha AND f.id <> :file_id
+      AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
+    LIMIT 1
+""")
+
+_COPY_FILE_CHUNKS_SQL = text("""
+    INSERT INTO chunks(file_id, start_line, end_line, embedding)
+    SELECT :file_id, start_line, end_line, embedding
+    FROM chunks
+    WHERE file_id = :src_id
+""")
+
+_STAMP_FILE_SQL = text("""
+    UPDATE files
+    SET blob_sha = :blob_sha, content_hash = :content_hash, commit = :commit
+    WHERE id = :file_id
+""")
+
+# Stamp many already-indexed files of one repo in a single statement.
+_UPDATE_FILE_HASHES_SQL = text("""
+    UPDATE files f
+    SET commit = :commit, content_hash = v.content_hash, blob_sha = v.blob_sha
+    FROM repos r,
+         unnest(CAST(:paths AS text[]), CAST(:hashes AS text[]), CAST(:shas AS text[]))
+           AS v(path, content_hash, blob_sha)
+    WHERE r.owner = :owner AND r.name = :name
+      AND f.repo_id = r.id AND f.path = v.path
+""")
+
+# Transaction-local, like SET LOCAL, but accepts a bound parameter.
+_SET_EF_SEARCH_SQL = text("SELECT set_config('hnsw.ef_search', :ef, true)")
+
+# No `embedding IS NOT NULL` filter in the KNN queries: HNSW never indexes
+# NULL vectors, and the extra predicate can push the planner off the index.
+
+# Top-k over `chunks` alone first, then join `files` for just those k rows.
+# The LIMIT inside `top` keeps it an un-flattenable subquery, so the planner
+# can't push the join below the HNSW scan or fetch paths for extra rows.
+_KNN_PATHS_SQL = text("""
+    WITH top AS (
+        SELECT id, file_id, start_line, end_line, (embedding <=> :q) AS dist
+        FROM chunks
+        ORDER BY embedding <=> :q
+        LIMIT :k
+    )
+    SELECT f.path, t.start_line, t.end_line, t.dist, t.id AS chunk_id
+    FROM top t
+    JOIN files f ON f.id = t.file_id
+    ORDER BY t.dist
+""")
+
+# The newest embedding as a scalar subquery: Postgres runs it as an InitPlan
+# and treats the result as a constant, so the ORDER BY still binds to the HNSW
+# index (a CTE + CROSS JOIN would force a full sort). It appears once, in the
+# select list, and ORDER BY names that output column, so the text can't plan
+# into two InitPlans.
+_LAST_EMBEDDING = (
+    "(SELECT embedding FROM chunks WHERE embedding IS NOT NULL ORDER BY id DESC LIMIT 1)"
+)
+
+_KNN_FROM_LAST_SQL = text(f"""
+    WITH top AS (
+        SELECT id, file_id, start_line, end_line,
+               (embedding <=> {_LAST_EMBEDDING}) AS dist
+        FROM chunks
+        ORDER BY dist
+        LIMIT :k
+    )
+    SELECT f.path, t.start_line, t.end_line, t.dist, t.id AS chunk_id
+    FROM top t
+    JOIN files f ON f.id = t.file_id
+    ORDER BY t.dist
+""")
+
 # --- Vector helpers -------------------------------------------------------
 
-def _vec_literal(vec: List[float], dim: int = EMBED_DIM) -> str:
-    if len(vec) != dim:
-        raise ValueError(f"vector must be length {dim}, got {len(vec)}")
-    return "[" + ",".join(f"{x:.10g}" for x in vec) + "]"
+def _vec_param(vec: List[float] | np.ndarray, dim: int = EMBED_DIM) -> HalfVector:
+    # No copy when `vec` is already a contiguous float32 array (embedder output).
+    arr = np.ascontiguousarray(vec, dtype=np.float32)
+    if arr.shape != (dim,):
+        raise ValueError(f"vector must have shape ({dim},), got {arr.shape}")
+    # register_vector sends HalfVector as binary halfvec: 2 bytes/dim on the
+    # wire and no server-side text parse or vector->halfvec cast.
+    return HalfVector(arr)
 
-def insert_chunk_with_vec(owner: str, name: str, path: str, start_line: int, end_line: int, embedding: List[float]) -> dict:
-    vec = _vec_literal(embedding, EMBED_DIM)
+def insert_chunk_with_vec(owner: str, name: str, path: str, start_line: int, end_line: int, embedding: List[float] | np.ndarray) -> dict:
+    vec = _vec_param(embedding, EMBED_DIM)
+    params = {
+        "owner": owner,
+        "name": name,
+        "path": path,
+        "start": start_line,
+        "end": end_line,
+        "embedding": vec,
+    }
     with engine.begin() as conn:
-        repo_id = conn.execute(
-            text("""
-                INSERT INTO repos(owner, name, default_branch)
-                VALUES (:owner, :name, 'main')
-                ON CONFLICT (owner, name) DO UPDATE
-                SET default_branch = COALESCE(EXCLUDED.default_branch, repos.default_branch)
-                RETURNING id
-            """),
-            {"owner": owner, "name": name},
-        ).scalar_one()
-
-        file_id = conn.execute(
-            text("""
-                INSERT INTO files(repo_id, path, commit, content_hash)
-                VALUES (:repo_id, :path, NULL, NULL)
-                ON CONFLICT (repo_id, path) DO UPDATE
-                SET commit = COALESCE(EXCLUDED.commit, files.commit),
-                    content_hash = COALESCE(EXCLUDED.content_hash, files.content_hash)
-                RETURNING id
-            """),
-            {"repo_id": repo_id, "path": path},
-        ).scalar_one()
-
-        chunk_id = conn.execute(
-            text(f"""
-                INSERT INTO chunks(file_id, start_line, end_line, embedding)
-                VALUES (:file_id, :start, :end, (:embedding)::vector({EMBED_DIM}))
-                RETURNING id
-            """),
-            {"file_id": file_id, "start": start_line, "end": end_line, "embedding": vec},
-        ).scalar_one()
-
-    return {"repo_id": repo_id, "file_id": file_id, "chunk_id": chunk_id}
-
-def knn_paths(query_vec: List[float], k: int = 5) -> List[dict]:
-    q = _vec_literal(query_vec, EMBED_DIM)
-    with engine.connect() as conn:
-        rows = conn.execute(
-            text(f"""
-                SELECT f.path, c.start_line, c.end_line,
-                       (c.embedding <-> (:q)::vector({EMBED_DIM})) AS dist,
-                       c.id AS chunk_id
-                FROM chunks c
-                JOIN files f ON f.id = c.file_id
-                WHERE c.embedding IS NOT NULL
-                ORDER BY c.embedding <-> (:q)::vector({EMBED_DIM})
-                LIMIT :k
-            """),
-            {"q": q, "k": k},
-        ).mappings().all()
-    return [dict(r) for r in rows]
+        row = conn.execute(_INSERT_CHUNK_SQL, params).one()
+
+    return {"repo_id": row.repo_id, "file_id": row.file_id, "chunk_id": row.chunk_id}
+
+def insert_chunks_bulk(
+    owner: str,
+    name: str,
+    rows: List[dict],
+    replace: bool = False,
+    blob_shas: Optional[Dict[str, str]] = None,
+    content_hashes: Optional[Dict[str, str]] = None,
+    commit: str | None = None,
+) -> dict:
+    """
+    Bulk variant of insert_chunk_with_vec. Each row is
+    {"path", "start_line", "end_line", "embedding"}.
+    One repo upsert, one files upsert for all distinct paths, then a
+    binary COPY for the chunks — instead of 3 round-trips per chunk.
+    replace=True first drops the existing chunks of those files (same tx).
+    blob_shas ({path: git blob sha}) records which blob the chunks came
+    from, for copy_blob_chunks; paths without one get NULL. content_hashes
+    ({path: hash}) and commit are stamped on the files in the same transaction.
+    """
+    if not rows:
+        return {"repo_id": None, "files": 0, "chunks": 0}
+    vecs = [_vec_param(r["embedding"], EMBED_DIM) for r in rows]
+    paths = sorted({r["path"] for r in rows})
+    shas = [blob_shas.get(p) for p in paths] if blob_shas else [None] * len(paths)
+    hashes = [content_hashes.get(p) for p in paths] if content_hashes else [None] * len(paths)
+    with engine.begin() as conn:
+        repo_id = conn.execute(_UPSERT_REPO_SQL, {"owner": owner, "name": name}).scalar_one()
+        params = {"repo_id": repo_id, "paths": paths, "blob_shas": shas, "hashes": hashes}
+        file_ids = dict(
+            conn.execute(_UPSERT_FILES_BULK_SQL, {**params, "commit": commit}).all()
+        )
+        if replace:
+            conn.execute(_DELETE_FILES_CHUNKS_SQL, {"file_ids": list(file_ids.values())})
+
+        # COPY runs on the same DBAPI connection, inside this transaction.
+        with conn.connection.dbapi_connection.cursor() as cur:
+            with cur.copy(_COPY_CHUNKS_SQL) as copy:
+                copy.set_types(["int8", "int4", "int4", "halfvec"])
+                for r, vec in zip(rows, vecs):
+                    copy.write_row(
+                        (file_ids[r["path"]], r["start_line"], r["end_line"], vec)
+                    )
+
+    return {"repo_id": repo_id, "files": len(file_ids), "chunks": len(rows)}
 
-def knn_from_last(k: int = 5) -> List[dict]:
+def insert_chunks_with_vecs(
+    owner: str,
+    name: str,
+    files: List[Tuple[str, List[Tuple[int, int, object]]]],
+    replace: bool = False,
+    blob_shas: Optional[Dict[str, str]] = None,
+    content_hashes: Optional[Dict[str, str]] = None,
+    commit: str | None = None,
+) -> dict:
+    """
+    Per-file batch form: files is [(path, [(start_line, end_line, embedding), ...])].
+    Same round-trips as insert_chunks_bulk regardless of how many chunks.
+    """
+    rows = [
+        {"path": path, "start_line": start, "end_line": end, "embedding": vec}
+        for path, chunks in files
+        for start, end, vec in chunks
+    ]
+    return insert_chunks_bulk(
+        owner,
+        name,
+        rows,
+        replace=replace,
+        blob_shas=blob_shas,
+        content_hashes=content_hashes,
+        commit=commit,
+    )
+
+def blob_shas_with_chunks(shas: List[str]) -> Set[str]:
+    """Which of these git blob SHAs already have chunks on some file (any repo)."""
+    if not shas:
+        return set()
     with engine.connect() as conn:
-        rows = conn.execute(
-            text(f"""
-                WITH q AS (
-                    SELECT embedding FROM chunks
-                    WHERE embedding IS NOT NULL
-                    ORDER BY id DESC
-                    LIMIT 1
-                )
-                SELECT f.path, c.start_line, c.end_line,
-                       (c.embedding <-> q.embedding) AS dist,
-                       c.id AS chunk_id
-                FROM chunks c
-                CROSS JOIN q
-                JOIN files f ON f.id = c.file_id
-                WHERE c.embedding IS NOT NULL
-                ORDER BY c.embedding <-> q.embedding
-                LIMIT :k
-            """),
-            {"k": k},
-        ).mappings().all()
+        return set(conn.execute(_BLOB_SHAS_WITH_CHUNKS_SQL, {"shas": shas}).scalars())
+
+def copy_blob_chunks(owner: str, name: str, path: str, blob_sha: str, commit: str | None) -> int:
+    """
+    Give `path` the chunks of another file built from the same git blob: same
+    bytes, same chunks and embeddings, so they're copied inside Postgres with
+    no fetch or embed. Returns the number copied; 0 if no such file has
+    chunks any more, and the caller embeds as usual.
+    """
+    with engine.begin() as conn:
+        repo_id = conn.execute(_UPSERT_REPO_SQL, {"owner": owner, "name": name}).scalar_one()
+        file_id = conn.execute(_UPSERT_FILE_SQL, {"repo_id": repo_id, "path": path}).scalar_one()
+        src = conn.execute(_BLOB_SOURCE_SQL, {"blob_sha": blob_sha, "file_id": file_id}).first()
+        if src is None:
+            return 0
+        conn.execute(_DELETE_FILES_CHUNKS_SQL, {"file_ids": [file_id]})
+        params = {"file_id": file_id, "src_id": src.id}
+        copied = conn.execute(_COPY_FILE_CHUNKS_SQL, params).rowcount
+        conn.execute(
+            _STAMP_FILE_SQL,
+            {
+                "file_id": file_id,
+                "blob_sha": blob_sha,
+                "content_hash": src.content_hash,
+                "commit": commit,
+            },
+        )
+    return copied
+
+def upsert_file_hashes(
+    owner: str, name: str, hashes: List[Tuple[str, str, str]], commit: str | None
+) -> int:
+    """
+    Stamp files whose rows already exist: hashes is
+    [(path, content_hash, blob_sha), ...]. One transaction for the lot.
+    """
+    if not hashes:
+        return 0
+    paths, digests, shas = zip(*hashes)
+    params = {"owner": owner, "name": name, "commit": commit}
+    with engine.begin() as conn:
+        return conn.execute(
+            _UPDATE_FILE_HASHES_SQL,
+            {**params, "paths": list(paths), "hashes": list(digests), "shas": list(shas)},
+        ).rowcount
+
+def _set_ef_search(conn, ef_search: int, k: int) -> None:
+    # An HNSW scan returns at most ef_search rows, so keep it >= k
+    # (pgvector caps it at 1000).
+    conn.execute(_SET_EF_SEARCH_SQL, {"ef": str(min(max(ef_search, k), 1000))})
+
+_KNN_STREAM_BATCH = 256
+
+@contextmanager
+def knn_paths_iter(
+    query_vec: List[float] | np.ndarray, k: int = 5, ef_search: int = HNSW_EF_SEARCH
+) -> Iterator[Iterator[dict]]:
+    """
+    `with knn_paths_iter(q, k) as rows:` iterates KNN rows as dicts. For k
+    above one batch the rows come through a server-side cursor
+    _KNN_STREAM_BATCH at a time, so memory stays flat. The pooled connection
+    and its transaction are held only inside the with block, however much of
+    `rows` was read.
+    """
+    q = _vec_param(query_vec, EMBED_DIM)
+    with engine.begin() as conn:
+        _set_ef_search(conn, ef_search, k)
+        if k > _KNN_STREAM_BATCH:
+            conn = conn.execution_options(stream_results=True)
+        result = conn.execute(_KNN_PATHS_SQL, {"q": q, "k": k}).mappings()
+        try:
+            yield (dict(r) for part in result.partitions(_KNN_STREAM_BATCH) for r in part)
+        finally:
+            result.close()
+
+def knn_paths(query_vec: List[float], k: int = 5, ef_search: int = HNSW_EF_SEARCH) -> List[dict]:
+    with knn_paths_iter(query_vec, k, ef_search) as rows:
+        return list(rows)
+
+def knn_from_last(k: int = 5, ef_search: int = HNSW_EF_SEARCH) -> List[dict]:
+    with engine.begin() as conn:
+        _set_ef_search(conn, ef_search, k)
+        rows = conn.execute(_KNN_FROM_LAST_SQL, {"k": k}).mappings().all()
     return [dict(r) for r in rows]
 
 async def indexed_paths_for_repo_owner_name(db: AsyncSession, owner: str, name: str) -> set[str]:
@@ -2,38 +2,88 @@ from __future__ import annotations
 
 import os
 import hashlib
-import traceback
+import logging
+import threading
 from typing import List, Dict
 
+import numpy as np
+
 # Single-source-of-truth: use LOCAL only.
 # Ensure your .env sets EMBED_DIM and LOCAL_EMBED_MODEL appropriately.
 EMBED_DIM = int(os.getenv("EMBED_DIM", "384"))
 LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "BAAI/bge-small-en-v1.5")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# fastembed data-parallel workers: unset = one ONNX session (already multi-threaded),
+# 0 = one worker process per core. Workers pay a model load each, so only worth it
+# for large batches.
+EMBED_PARALLEL = int(os.environ["EMBED_PARALLEL"]) if os.getenv("EMBED_PARALLEL") else None
+# "cuda" runs the ONNX session on the GPU (needs onnxruntime-gpu); anything else = CPU.
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "cpu").lower()
+EMBED_DEVICE_ID = int(os.getenv("EMBED_DEVICE_ID", "0"))
+# Per-chunk / per-vector debug output; off by default since it touches every chunk.
+DEBUG_EMBED = bool(os.getenv("DEBUG_EMBED"))
+
+log = logging.getLogger("indexer")
+log.setLevel(logging.DEBUG if DEBUG_EMBED else logging.INFO)
 
 _fast_model = None  # lazy loaded fastembed model instance
+_fast_model_lock = threading.Lock()  # concurrent indexers must not each load it
 
 
 def _load_local_model():
     """
     Lazy-load the local model (fastembed.TextEmbedding).
-    Prints verbose model load information.
+    Logs model load information.
     """
     global _fast_model
     if _fast_model is not None:
         return _fast_model
 
+    with _fast_model_lock:
+        if _fast_model is None:
+            _fast_model = _create_local_model()
+    return _fast_model
+
+
+def _create_local_model():
     try:
-        print(f"[EMBED-LOCAL] Loading local embed model `{LOCAL_EMBED_MODEL}` (expected dim={EMBED_DIM}) ...")
+        log.info("Loading local embed model `%s` (expected dim=%d) ...", LOCAL_EMBED_MODEL, EMBED_DIM)
         # lazy import so module only required when embedding is used
         from fastembed import TextEmbedding
 
-        _fast_model = TextEmbedding(model_name=LOCAL_EMBED_MODEL)
-        print(f"[EMBED-LOCAL] Model loaded: {LOCAL_EMBED_MODEL}")
-    except Exception as e:
-        print("[EMBED-LOCAL-ERR] Failed to load local model:", e)
-        print(traceback.format_exc())
+        device, providers = "cpu", None  # fastembed default: CPUExecutionProvider
+        if EMBED_DEVICE == "cuda":
+            device = "cuda"
+            providers = [
+                ("CUDAExecutionProvider", {"device_id": EMBED_DEVICE_ID}),
+                "CPUExecutionProvider",
+            ]
+        try:
+            model = TextEmbedding(model_name=LOCAL_EMBED_MODEL, providers=providers)
+        except ValueError as e:
+            # fastembed raises ValueError when a requested provider isn't available.
+            if providers is None:
+                raise
+            log.warning("CUDA unavailable (%s); falling back to CPU", e)
+            device = "cpu"
+            model = TextEmbedding(model_name=LOCAL_EMBED_MODEL)
+        log.info("Model loaded: %s device=%s", LOCAL_EMBED_MODEL, device)
+    except Exception:
+        log.exception("Failed to load local model")
         raise
-    return _fast_model
+    return model
+
+
+def compute_file_hash(data: str | bytes) -> str:
+    """
+    Content hash stored in files.content_hash; unchanged files can skip
+    chunking + embedding. BLAKE2b is faster than SHA-1/256 in hashlib.
+    Pass the raw blob bytes when you have them: no re-encode, same digest
+    as the UTF-8 text.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="ignore")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
 def chunk_code(text: str, max_chars: int | None = None, overlap: int | None = None) -> List[Dict]:
@@ -47,93 +97,85 @@ def chunk_code(text: str, max_chars: int | None = None, overlap: int | None = No
     lines = text.splitlines(keepends=True)
     if not lines:
         return []
+    n = len(lines)
+
+    # csum[j] = char offset of lines[j] in `text` (csum[n] == len(text)): a line
+    # range's size is one subtraction, chunk boundaries are binary searches, and
+    # chunk text is a single slice of `text` instead of a per-line loop + join.
+    csum = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, lines), dtype=np.int64, count=n), out=csum[1:])
 
     chunks = []
-    # Build chunks by accumulating lines until max_chars reached.
-    cur_lines = []
-    cur_chars = 0
-    start_line = 0
-
-    for i, ln in enumerate(lines):
-        ln_len = len(ln)
-        if cur_chars + ln_len > max_chars and cur_chars > 0:
-            # flush chunk
-            chunk_text = "".join(cur_lines)
-            chunks.append(
-                {
-                    "text": chunk_text,
-                    "start_line": start_line + 1,
-                    "end_line": i,
-                }
+    # A chunk is lines[ov:end]: `ov..start` is the overlap carried over from the
+    # previous chunk, `start..end` are new lines (what start_line/end_line report).
+    ov = start = 0
+    while True:
+        # Grow until the next line would push past max_chars (at least one new line).
+        end = int(csum.searchsorted(csum[ov] + max_chars, side="right")) - 1
+        end = min(max(end, start + 1), n)
+        chunks.append(
+            {
+                "text": text[csum[ov] : csum[end]],
+                "start_line": start + 1,
+                "end_line": end,
+            }
+        )
+        if end == n:
+            break
+        # Carry over the trailing whole lines that fit within `overlap` chars.
+        # The previous carry-over counts as one unit: all of it or none.
+        cut = int(csum.searchsorted(csum[end] - overlap, side="left"))
+        if cut < start:
+            cut = ov if cut <= ov else start
+        ov, start = cut, end
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "chunk: input_len_chars=%d lines=%d chunks=%d max_chars=%d overlap=%d",
+            len(text), len(lines), len(chunks), max_chars, overlap,
+        )
+        for idx, c in enumerate(chunks, start=1):
+            log.debug(
+                "chunk #%02d lines=%d..%d chars=%d preview=%r",
+                idx, c["start_line"], c["end_line"], len(c["text"]), c["text"][:200],
             )
-            # prepare overlap: keep last 'overlap' chars worth of tail
-            tail = ""
-            tail_chars = 0
-            # greedily keep trailing lines until we hit overlap
-            for rev_ln in reversed(cur_lines):
-                if tail_chars + len(rev_ln) > overlap:
-                    break
-                tail = rev_ln + tail
-                tail_chars += len(rev_ln)
-            cur_lines = [tail] if tail else []
-            cur_chars = len(tail)
-            start_line = i
-        cur_lines.append(ln)
-        cur_chars += ln_len
-
-    # flush remaining
-    if cur_lines:
-        chunk_text = "".join(cur_lines)
-        chunks.append({"text": chunk_text, "start_line": start_line + 1, "end_line": len(lines)})
-
-    # Debug info
-    print(f"[CHUNK] input_len_chars={len(text)} lines={len(lines)} chunks={len(chunks)} max_chars={max_chars} overlap={overlap}")
-    for idx, c in enumerate(chunks, start=1):
-        preview = c["text"][:200].replace("\n", "\\n")
-        print(f"[CHUNK] #{idx:02d} lines={c['start_line']}..{c['end_line']} chars={len(c['text'])} preview={preview!r}")
 
     return chunks
 
 
-def _embed_local(texts: List[str]) -> List[List[float]]:
+def _embed_local(texts: List[str]) -> np.ndarray:
     """
-    Embed using local fastembed model only. Very verbose printing.
-    Returns list of vectors (list of floats).
+    Embed using local fastembed model only.
+    Returns a (len(texts), EMBED_DIM) float32 array; rows bind straight to pgvector.
     """
     if not texts:
-        return []
+        return np.empty((0, EMBED_DIM), dtype=np.float32)
 
     try:
         model = _load_local_model()
-        print(f"[EMBED-LOCAL] Embedding {len(texts)} texts (showing preview + vector shape).")
-        # print preview for each text
-        for i, t in enumerate(texts, start=1):
-            preview = t[:300].replace("\n", "\\n")
-            print(f"[EMBED-LOCAL] Text #{i:03d} len={len(t)} preview={preview!r}")
-
-        # fastembed returns an iterator/sequence of numpy arrays; convert to python floats
-        raw_vecs = list(model.embed(texts))
-        vecs: List[List[float]] = [list(map(float, v)) for v in raw_vecs]
-
-        # sanity checks and verbose print
-        for i, v in enumerate(vecs, start=1):
-            if v is None:
-                print(f"[EMBED-LOCAL-ERR] #{i} got None vector")
-                continue
-            # print shape + first few dims
-            dim = len(v)
-            print(f"[EMBED-LOCAL] #{i:03d} vector_dim={dim} first12={[round(x,6) for x in v[:12]]} ...")
-            if dim != EMBED_DIM:
-                print(f"[EMBED-LOCAL-WARN] vector_dim {dim} != EMBED_DIM {EMBED_DIM}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Embedding %d texts", len(texts))
+            for i, t in enumerate(texts, start=1):
+                log.debug("text #%03d len=%d preview=%r", i, len(t), t[:300])
+
+        # fastembed yields one float32 array per text; stack into one buffer.
+        vecs = np.stack(
+            list(model.embed(texts, batch_size=EMBED_BATCH_SIZE, parallel=EMBED_PARALLEL))
+        ).astype(np.float32, copy=False)
+
+        if vecs.shape[1] != EMBED_DIM:
+            log.warning("vector_dim %d != EMBED_DIM %d", vecs.shape[1], EMBED_DIM)
+        if log.isEnabledFor(logging.DEBUG):
+            for i, v in enumerate(vecs, start=1):
+                log.debug("vec #%03d dim=%d first12=%s ...", i, len(v), np.round(v[:12], 6).tolist())
 
         return vecs
-    except Exception as e:
-        print("[EMBED-LOCAL-ERR] exception during local embedding:", e)
-        print(traceback.format_exc())
+    except Exception:
+        log.exception("exception during local embedding")
         raise
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+def embed_texts(texts: List[str]) -> np.ndarray:
     """
     Public wrapper. Uses only local embedding.
     """
@@ -143,10 +185,11 @@ def embed_texts(texts: List[str]) -> List[List[float]]:
 # Small helper so you can do a basic smoke test if you run indexer.py directly.
 if __name__ == "__main__":
     sample = "def hello():\n    print('hello world')\n" * 20
+    logging.basicConfig(level=logging.DEBUG if DEBUG_EMBED else logging.INFO)
     print("=== indexer.py self-test ===")
     ch = chunk_code(sample, max_chars=200, overlap=50)
     texts = [c["text"] for c in ch]
     vecs = embed_texts(texts)
     print(f"Self-test: chunks={len(ch)} vectors={len(vecs)}")
     for i, v in enumerate(vecs, start=1):
-        print(f"  vec#{i} dim={len(v)} sample_first8={[round(x,6) for x in (v[:8] if v else [])]}")
\ No newline at end of file
+        print(f"  vec#{i} dim={len(v)} sample_first8={np.round(v[:8], 6).tolist()}")
\ No newline at end of file
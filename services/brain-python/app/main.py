@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+import importlib
+import logging
 import os
-import random
+from contextlib import asynccontextmanager
 from typing import List, Annotated
 
-from fastapi import FastAPI, HTTPException
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
@@ -15,12 +19,44 @@ from .db import (
     knn_paths,
     knn_from_last,
     EMBED_DIM,
+    HNSW_EF_SEARCH,
 )
 from .auth import router as auth_router
 from .github import router as github_router
-from .repos import router as repos_router
+from .repos import router as repos_router, shutdown_index_jobs
+from .clients import github as gh_client
 
-app = FastAPI()
+# App loggers (e.g. "indexer") go to stderr; uvicorn keeps its own handlers.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+# Load the embed model at boot so the first index request doesn't pay the
+# multi-second fastembed load. EMBED_PRELOAD=0 keeps it lazy (e.g. API-only dev).
+EMBED_PRELOAD = os.getenv("EMBED_PRELOAD", "1") == "1"
+
+async def _preload_embed_model():
+    if not EMBED_PRELOAD:
+        return
+    try:
+        idx = importlib.import_module(".indexer", package=__package__)
+        await asyncio.to_thread(idx._load_local_model)
+    except Exception:
+        # Already logged by the indexer; indexing will retry the load on first use.
+        logging.getLogger(__name__).warning("Embed model preload failed; loading lazily")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _preload_embed_model()
+    app.state.index_jobs = {}
+    yield
+    # Background index jobs outlive their requests; stop them before the pools go.
+    await shutdown_index_jobs(app)
+    # Drain the pooled GitHub client's keep-alive connections.
+    await gh_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 WEB_ORIGIN = os.getenv("WEB_ORIGIN", "http://localhost:3000")
 app.add_middleware(
@@ -68,28 +104,60 @@ def embed_vector(body: EmbedVecIn):
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
+_HALF_MAX = float(np.finfo(np.float16).max)
+
+@app.post("/embed-vector-bin")
+async def embed_vector_bin(
+    request: Request, owner: str, name: str, path: str, start_line: int = 1, end_line: int = 20
+):
+    """
+    /embed-vector with the embedding as the raw body: EMBED_DIM little-endian
+    float32s (application/octet-stream). No JSON float list to parse and
+    validate; the buffer is viewed in place.
+    """
+    body = await request.body()
+    if len(body) != EMBED_DIM * 4:
+        raise HTTPException(
+            status_code=422,
+            detail=f"body must be {EMBED_DIM * 4} bytes ({EMBED_DIM} float32), got {len(body)}",
+        )
+    vec = np.frombuffer(body, dtype="<f4")
+    if not np.isfinite(vec).all():
+        raise HTTPException(status_code=422, detail="embedding contains NaN/inf")
+    # Stored as halfvec: larger finite float32s would become inf there.
+    if np.abs(vec).max() > _HALF_MAX:
+        raise HTTPException(
+            status_code=422, detail=f"embedding values must be within ±{_HALF_MAX:g} (halfvec)"
+        )
+    ids = await asyncio.to_thread(insert_chunk_with_vec, owner, name, path, start_line, end_line, vec)
+    return {"ok": True, **ids}
+
+_rng = np.random.default_rng()
+
 @app.post("/dev/embed-random")
 def embed_random(owner: str, name: str, path: str, start_line: int = 1, end_line: int = 20):
     if os.getenv("DEV", "1") != "1":
         raise HTTPException(status_code=403, detail="DEV helpers disabled")
-    rand_vec = [random.random() for _ in range(EMBED_DIM)]
+    # One C call straight to float32, the dtype _vec_param sends as-is.
+    rand_vec = _rng.random(EMBED_DIM, dtype=np.float32)
     ids = insert_chunk_with_vec(owner, name, path, start_line, end_line, rand_vec)
     return {"ok": True, **ids}
 
 class SearchIn(BaseModel):
     query: Embedding
     k: int = 5
+    ef_search: int = Field(HNSW_EF_SEARCH, ge=1, le=1000)
 
 @app.post("/search")
 def search(body: SearchIn):
     try:
-        return {"results": knn_paths(body.query, body.k)}
+        return {"results": knn_paths(body.query, body.k, body.ef_search)}
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 @app.get("/dev/search-last")
-def search_last(k: int = 5):
-    return {"results": knn_from_last(k)}
+def search_last(k: int = 5, ef_search: int = HNSW_EF_SEARCH):
+    return {"results": knn_from_last(k, ef_search)}
 
 # Routers
 app.include_router(auth_router)
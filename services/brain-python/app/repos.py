@@ -2,118 +2,256 @@
 from __future__ import annotations
 
 import os
-import json
-import base64
-import hashlib
+import re
 import asyncio
 import httpx
 import importlib
+import orjson
 import codecs
-from typing import List, Dict, Set, Tuple, Optional
-
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, NamedTuple, Set, Tuple, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from .schemas import RepoFilesResponse, FileStatus, RepoInfo
-from .db import get_db, GithubAccount, dec, engine, insert_chunk_with_vec, EMBED_DIM
-from .github import current_user
+from .schemas import RepoFilesResponse
+from .db import (
+    SessionLocal,
+    get_db,
+    insert_chunks_with_vecs,
+    upsert_file_hashes,
+    blob_shas_with_chunks,
+    copy_blob_chunks,
+)
+from .github import current_user, current_user_with_gh
+from .clients import github as gh_client
 
 router = APIRouter(prefix="/repos", tags=["repos"])
-
-GITHUB_API = "https://api.github.com"
+log = logging.getLogger("repos")
+
+# Files indexed concurrently by the batch endpoint (each holds a DB connection while writing).
+INDEX_CONCURRENCY = max(1, int(os.getenv("INDEX_CONCURRENCY", "4")))
+# Blob downloads in flight per stream, and fetched blobs buffered ahead of the indexer.
+BLOB_FETCH_CONCURRENCY = max(1, int(os.getenv("BLOB_FETCH_CONCURRENCY", "10")))
+BLOB_PREFETCH = 32
+# Per-directory tree listings in flight when a recursive listing is truncated.
+TREE_WALK_CONCURRENCY = max(1, int(os.getenv("TREE_WALK_CONCURRENCY", "16")))
+# Embedding runs here, off the event loop. A small pool: the ONNX session is
+# already multi-threaded, so more workers just contend for the same cores.
+EMBED_WORKERS = max(1, int(os.getenv("EMBED_WORKERS", "2")))
+_EMBED_POOL = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+# Chunks from files indexed together are embedded in one model call of up to
+# EMBED_COALESCE texts; a partial batch waits at most EMBED_LINGER_MS for more.
+EMBED_COALESCE = max(1, int(os.getenv("EMBED_COALESCE", "64")))
+EMBED_LINGER = int(os.getenv("EMBED_LINGER_MS", "50")) / 1000
+# Files either indexer has in flight at once. Small files yield 1-3 chunks, so
+# it takes many in flight to fill an embed batch; DB writes are short and share the pool.
+STREAM_FILES_IN_FLIGHT = max(1, int(os.getenv("STREAM_FILES_IN_FLIGHT", "16")))
+# SSE comment sent when no event was ready for this long: keeps proxies and the
+# browser from timing out while a large embed batch or slow blob is in flight.
+SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT_MS", "250")) / 1000
+_SSE_KEEPALIVE = b":keepalive\n\n"
 MAX_BLOB_BYTES = int(os.getenv("MAX_INDEX_BLOB_BYTES", str(512 * 1024)))  # 512 KB
-SKIP_EXTS = {
+SKIP_EXTS = frozenset(
     x.strip().lower()
     for x in os.getenv(
         "SKIP_FILE_EXTS",
         # Skip common binaries + large/low-value assets by default
         ".png,.jpg,.jpeg,.gif,.pdf,.zip,.tar,.gz,.7z,.exe,.dll,.so,.dylib,.bin,.ico,.svg",
     ).split(",")
-}
+)
+# Directories whose contents are never indexed (dependencies, build output),
+# matched at any depth: one regex search instead of splitting every path.
+SKIP_DIRS = tuple(
+    d.strip().strip("/")
+    for d in os.getenv("SKIP_DIRS", "node_modules,vendor,dist,.git,__pycache__,.venv").split(",")
+    if d.strip().strip("/")
+)
+_SKIP_DIRS_RE = re.compile(
+    r"(?:^|/)(?:%s)/" % "|".join(map(re.escape, SKIP_DIRS)) if SKIP_DIRS else r"(?!)"
+)
+
+
+# A commit's tree never changes, so entries keyed by head SHA need no expiry.
+_TREE_CACHE_MAX = 256
+_tree_cache: OrderedDict[Tuple[str, str, str], List[TreeEntry]] = OrderedDict()
+# Indexed-path sets are dropped whenever this process writes a repo; the TTL
+# bounds staleness from writes made elsewhere (other workers, migrations).
+INDEXED_CACHE_TTL = float(os.getenv("INDEXED_CACHE_TTL", "10"))
+_INDEXED_CACHE_MAX = 512
+_indexed_cache: OrderedDict[Tuple[str, str], Tuple[float, Set[str]]] = OrderedDict()
+
+
+def _lru_put(cache: OrderedDict, key, value, maxsize: int) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > maxsize:
+        cache.popitem(last=False)
 
 
 # --- GitHub helpers --------------------------------------------------------
 
 
-def _gh_get(token: str, url: str) -> Dict:
-    if not url.startswith("http"):
-        url = f"{GITHUB_API}{url}"
-    r = httpx.get(
-        url,
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        },
-        timeout=20.0,
-    )
-    r.raise_for_status()
-    return r.json()
-
-
-def _get_repo_info_by_id(token: str, repo_id: int) -> Dict:
-    data = _gh_get(token, f"/repositories/{repo_id}")
-    owner, name = data["full_name"].split("/", 1)
-    return {
-        "github_id": data["id"],
-        "owner": owner,
-        "name": name,
-        "default_branch": data["default_branch"],
-    }
+async def _gh_get(token: str, url: str) -> Dict:
+    # Shared pooled HTTP/2 client: keep-alive across calls and no blocking of
+    # the event loop while GitHub answers.
+    return await gh_client.gh_get(token, url)
+
+
+async def _get_repo_info_by_id(token: str, repo_id: int) -> Dict:
+    return await gh_client.get_repo_info_by_id(token, repo_id)
 
 
-def _resolve_branch_and_head(
+async def _resolve_branch_and_head(
     token: str, owner: str, name: str, default_branch: str
 ) -> Tuple[str, str]:
     """Returns (branch_name, head_sha). Falls back if default branch 404s."""
     try:
-        branch = _gh_get(token, f"/repos/{owner}/{name}/branches/{default_branch}")
+        # Conditional GET: an unchanged head comes back 304 and costs no rate limit.
+        branch = await gh_client.gh_get_conditional(
+            token, f"/repos/{owner}/{name}/branches/{default_branch}"
+        )
         return branch["name"], branch["commit"]["sha"]
     except httpx.HTTPStatusError as e:
         if e.response.status_code != 404:
             raise
-        branches = _gh_get(token, f"/repos/{owner}/{name}/branches")
+        branches = await gh_client.gh_get_conditional(token, f"/repos/{owner}/{name}/branches")
         if not branches:
             raise HTTPException(status_code=404, detail="No branches found in repo")
         branch = branches[0]
         return branch["name"], branch["commit"]["sha"]
 
 
-def _get_tree_entries(
+async def _get_head_tree(token: str, info: Dict) -> Tuple[str, str, List[TreeEntry]]:
+    """(branch_name, head_sha, tree entries) of the repo's default branch."""
+    branch_name, head_sha = await _resolve_branch_and_head(
+        token, info["owner"], info["name"], info["default_branch"]
+    )
+    entries = await _get_tree_entries(token, info["owner"], info["name"], head_sha)
+    return branch_name, head_sha, entries
+
+
+class TreeEntry(NamedTuple):
+    # A tuple, not a dict per blob: ~3x smaller in the tree cache, and fields
+    # are read by index rather than hashed key lookups.
+    path: str
+    sha: str
+    size: Optional[int]
+
+
+async def _get_tree_entries(
     token: str, owner: str, name: str, head_sha: str
-) -> List[Dict]:
-    tree = _gh_get(token, f"/repos/{owner}/{name}/git/trees/{head_sha}?recursive=1")
-    entries = []
-    for e in tree.get("tree", []):
-        if e.get("type") == "blob":
-            entries.append({"path": e["path"], "sha": e["sha"], "size": e.get("size")})
-    return sorted(entries, key=lambda x: x["path"])
+) -> List[TreeEntry]:
+    """Sorted blob entries of the commit's tree. Cached; callers must not mutate the list."""
+    key = (owner, name, head_sha)
+    cached = _tree_cache.get(key)
+    if cached is not None:
+        _tree_cache.move_to_end(key)
+        return cached
+
+    tree = await _gh_get(token, f"/repos/{owner}/{name}/git/trees/{head_sha}?recursive=1")
+    if tree.get("truncated"):
+        # Past GitHub's recursive listing limit the response silently drops
+        # entries; rebuild it from per-directory listings instead.
+        entries = await _walk_tree(token, owner, name, head_sha)
+    else:
+        entries = _tree_blobs(tree, "")
+    # Paths are unique within a tree, so plain tuple order is path order.
+    entries.sort()
+    _lru_put(_tree_cache, key, entries, _TREE_CACHE_MAX)
+    return entries
+
+
+def _tree_blobs(tree: Dict, prefix: str) -> List[TreeEntry]:
+    return [
+        TreeEntry(prefix + e["path"], e["sha"], e.get("size"))
+        for e in tree.get("tree", [])
+        if e.get("type") == "blob"
+    ]
+
+
+async def _walk_tree(token: str, owner: str, name: str, root_sha: str) -> List[TreeEntry]:
+    """
+    Blob entries of a tree too big for one recursive listing. Each directory
+    is first tried as one recursive call; only directories that are
+    themselves truncated get split into their children. Fetches run
+    concurrently, TREE_WALK_CONCURRENCY at a time.
+    """
+    sem = asyncio.Semaphore(TREE_WALK_CONCURRENCY)
+    url = f"/repos/{owner}/{name}/git/trees"
+    entries: List[TreeEntry] = []
+
+    async def walk(sha: str, prefix: str, truncated: bool = False) -> None:
+        if not truncated:
+            async with sem:
+                tree = await _gh_get(token, f"{url}/{sha}?recursive=1")
+            if not tree.get("truncated"):
+                entries.extend(_tree_blobs(tree, prefix))
+                return
+        async with sem:
+            tree = await _gh_get(token, f"{url}/{sha}")
+        entries.extend(_tree_blobs(tree, prefix))
+        await asyncio.gather(
+            *(
+                walk(e["sha"], f"{prefix}{e['path']}/")
+                for e in tree.get("tree", [])
+                if e.get("type") == "tree"
+            )
+        )
+
+    await walk(root_sha, "", truncated=True)
+    return entries
 
 
-def _get_blob_text(
+async def _get_blob_text(
     token: str, owner: str, name: str, blob_sha: str, size: Optional[int]
-) -> Optional[str]:
+) -> Optional[Tuple[str, str]]:
     """
-    Fetch a blob and return UTF-8/UTF-16 text, or None if binary/too large.
-    Robust to GitHub’s newline-broken base64.
+    Fetch a blob and return (UTF-8/UTF-16 text, content hash), or None if
+    binary/too large. Requested raw, so there is no base64 to decode.
     """
     if size and int(size) > MAX_BLOB_BYTES:
         return None
 
-    data = _gh_get(token, f"/repos/{owner}/{name}/git/blobs/{blob_sha}")
-    if data.get("encoding") != "base64":
+    raw = await gh_client.gh_get_raw(token, f"/repos/{owner}/{name}/git/blobs/{blob_sha}")
+    if len(raw) > MAX_BLOB_BYTES:
         return None
 
-    content_b64 = (data.get("content") or "").encode("utf-8")
-    try:
-        raw = base64.b64decode(content_b64, validate=False)  # allow newlines/whitespace
-    except Exception:
-        raw = base64.b64decode(b"".join(content_b64.split()))
-
-    if len(raw) > MAX_BLOB_BYTES:
+    text = _decode_blob(raw)
+    if text is None:
         return None
+    # Hash the fetched bytes as-is rather than re-encoding the decoded text
+    # (identical digest for UTF-8 blobs, so stored hashes stay valid).
+    compute_file_hash = _load_indexer()[2]
+    return text, compute_file_hash(raw)
+
+
+# Bytes sniffed for NULs before any decode attempt (git's own binary check).
+_SNIFF_BYTES = 8192
+
+
+def _decode_blob(raw: bytes) -> Optional[str]:
+    # A NUL near the start means binary unless it looks like UTF-16, whose
+    # ASCII range is every other byte NUL. Bail before decoding the whole blob.
+    head = raw[:_SNIFF_BYTES]
+    if b"\x00" in head:
+        if not (
+            raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE))
+            or head.count(b"\x00") > max(1, len(head) // 50)
+        ):
+            return None
+        # UTF-16 it is: NULs are valid UTF-8, so trying that first would
+        # "succeed" with a NUL between every character.
+        try:
+            return raw.decode("utf-16", errors="strict")
+        except UnicodeDecodeError:
+            return None
 
     # Try common encodings
     try:
@@ -143,62 +281,256 @@ def _get_blob_text(
     return None
 
 
-def _indexed_paths(db: Session, owner: str, name: str) -> Set[str]:
+# EXISTS, not JOIN + DISTINCT: the semi-join stops at a file's first chunk via
+# an index-only probe of ix_chunks_file_id_cover, while DISTINCT visits every
+# chunk row and then hashes the paths (~20% slower on a 20k-file repo).
+_INDEXED_PATHS_SQL = text(
+    """
+  SELECT f.path
+  FROM files f
+  JOIN repos r ON r.id = f.repo_id
+  WHERE r.owner = :owner AND r.name = :name
+    AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
+"""
+)
+
+
+def _query_indexed_paths(owner: str, name: str) -> Set[str]:
+    # Own Session: this runs in a thread, concurrently with the request's work.
+    with SessionLocal() as db:
+        return set(db.execute(_INDEXED_PATHS_SQL, {"owner": owner, "name": name}).scalars())
+
+
+async def _indexed_paths(owner: str, name: str) -> Set[str]:
+    """Paths of the repo that have chunks. Cached briefly; callers must not mutate the set."""
+    key = (owner, name)
+    cached = _indexed_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < INDEXED_CACHE_TTL:
+        return cached[1]
+
+    paths = await asyncio.to_thread(_query_indexed_paths, owner, name)
+    # The cache is only written on the event loop.
+    _lru_put(_indexed_cache, key, (time.monotonic(), paths), _INDEXED_CACHE_MAX)
+    return paths
+
+
+# Set difference done in Postgres: the tree's (path, blob sha) pairs go in as
+# two arrays, and only the first :limit whose chunks are missing or were built
+# from another blob come back (by position, in tree order), with the stored
+# content_hash of stale ones, plus how many are pending in total for the
+# "already indexed" count.
+_NOT_INDEXED_SQL = text(
+    """
+  SELECT u.ord, cur.content_hash, count(*) OVER () AS pending
+  FROM unnest(CAST(:paths AS text[]), CAST(:shas AS text[])) WITH ORDINALITY AS u(path, sha, ord)
+  LEFT JOIN LATERAL (
+    SELECT f.content_hash, f.blob_sha
+    FROM files f
+    JOIN repos r ON r.id = f.repo_id
+    WHERE r.owner = :owner AND r.name = :name
+      AND f.path = u.path
+      AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
+  ) cur ON true
+  WHERE cur.blob_sha IS DISTINCT FROM u.sha
+  ORDER BY u.ord
+  LIMIT :limit
+"""
+)
+
+
+def _not_indexed(
+    db: Session, owner: str, name: str, entries: List[TreeEntry], limit: int
+) -> Tuple[List[TreeEntry], Dict[str, str], int]:
+    """
+    (first `limit` entries without chunks for their tree blob, in tree order;
+    {path: stored content_hash} for those that have stale chunks; how many
+    entries are already indexed at their tree blob). A file whose blob changed
+    but whose text hashes the same is skipped as "unchanged" by the indexers.
+    """
+    if not entries:
+        return [], {}, 0
     rows = db.execute(
-        text(
-            """
-          SELECT f.path
-          FROM files f
-          JOIN repos r ON r.id = f.repo_id
-          WHERE r.owner = :owner AND r.name = :name
-            AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
-        """
-        ),
-        {"owner": owner, "name": name},
+        _NOT_INDEXED_SQL,
+        {
+            "owner": owner,
+            "name": name,
+            "paths": [e.path for e in entries],
+            "shas": [e.sha for e in entries],
+            "limit": limit,
+        },
     ).all()
-    return {row[0] for row in rows}
+    pending = rows[0].pending if rows else 0
+    to_index = [entries[row.ord - 1] for row in rows]
+    stored = {e.path: row.content_hash for e, row in zip(to_index, rows) if row.content_hash}
+    return to_index, stored, len(entries) - pending
 
 
-def _get_user_github_token(db: Session, user_id: int) -> str | None:
-    acct = db.query(GithubAccount).filter_by(user_id=user_id).first()
-    return dec(acct.access_token_enc) if acct else None
+_INDEXED_COUNT_SQL = text(
+    """
+  SELECT count(*)
+  FROM files f
+  JOIN repos r ON r.id = f.repo_id
+  WHERE r.owner = :owner AND r.name = :name
+    AND f.path = ANY(:paths)
+    AND EXISTS (SELECT 1 FROM chunks c WHERE c.file_id = f.id)
+"""
+)
+
+
+def _query_indexed_count(owner: str, name: str, paths: List[str]) -> int:
+    # Own Session, like _query_indexed_paths: this runs in a thread.
+    with SessionLocal() as db:
+        return db.execute(
+            _INDEXED_COUNT_SQL, {"owner": owner, "name": name, "paths": paths}
+        ).scalar_one()
+
+
+async def _indexed_count(owner: str, name: str, paths: List[str]) -> int:
+    """How many of `paths` have chunks, counted in Postgres (or from a fresh cache entry)."""
+    cached = _indexed_cache.get((owner, name))
+    if cached is not None and time.monotonic() - cached[0] < INDEXED_CACHE_TTL:
+        indexed = cached[1]
+        return sum(1 for p in paths if p in indexed)
+    if not paths:
+        return 0
+    return await asyncio.to_thread(_query_indexed_count, owner, name, paths)
+
+
+def _invalidate_indexed(owner: str, name: str) -> None:
+    _indexed_cache.pop((owner, name), None)
+
+
+def _is_skipped(path: str) -> bool:
+    # One rfind + one slice instead of splitext's (root, ext) pair; a dot in a
+    # directory name yields a slice containing "/" that never matches.
+    i = path.rfind(".")
+    if i != -1 and path[i:].lower() in SKIP_EXTS:
+        return True
+    return _SKIP_DIRS_RE.search(path) is not None
+
+
+def _split_reusable(
+    entries: List[TreeEntry], reusable: Set[str]
+) -> Tuple[List[TreeEntry], List[TreeEntry]]:
+    """
+    (fetch, reuse): reuse holds entries whose blob SHA already has chunks in the
+    DB or repeats an earlier entry's SHA; their chunks can be copied rather than
+    fetched and embedded. Every first occurrence of a SHA lands in fetch.
+    """
+    fetch: List[TreeEntry] = []
+    reuse: List[TreeEntry] = []
+    seen: Set[str] = set()
+    for e in entries:
+        sha = e.sha
+        (reuse if sha in reusable or sha in seen else fetch).append(e)
+        seen.add(sha)
+    return fetch, reuse
 
 
 def _load_indexer():
     """
     Try both 'app.indexer' and 'indexer' import styles so this works
-    in dev and inside the Docker image. Returns (chunk_code, embed_texts).
+    in dev and inside the Docker image.
+    Returns (chunk_code, embed_texts, compute_file_hash).
     """
     try:
         idx = importlib.import_module(".indexer", package=__package__)
     except Exception:
         idx = importlib.import_module("indexer")
-    return getattr(idx, "chunk_code"), getattr(idx, "embed_texts")
+    return (
+        getattr(idx, "chunk_code"),
+        getattr(idx, "embed_texts"),
+        getattr(idx, "compute_file_hash"),
+    )
+
+
+class _EmbedBatcher:
+    """
+    Coalesces embed calls from concurrently indexed files (often 1-3 chunks
+    each) into model calls of ~EMBED_COALESCE texts, then hands each caller
+    back its own slice of the vectors. One per indexing request.
+    """
+
+    def __init__(self, embed_texts):
+        self._embed_texts = embed_texts
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def embed(self, texts: List[str]):
+        fut = asyncio.get_running_loop().create_future()
+        await self._pending.put((texts, fut))
+        return await fut
+
+    async def aclose(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._pending.get()]
+            n = len(batch[0][0])
+            deadline = loop.time() + EMBED_LINGER
+            while n < EMBED_COALESCE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                n += len(item[0])
+
+            texts = [t for ts, _ in batch for t in ts]
+            try:
+                vecs = await loop.run_in_executor(_EMBED_POOL, self._embed_texts, texts)
+            except Exception as ex:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(ex)
+                continue
+            i = 0
+            for ts, fut in batch:
+                if not fut.done():
+                    fut.set_result(vecs[i : i + len(ts)])
+                i += len(ts)
+
+
+def _sse(event: bytes, data) -> bytes:
+    # One bytes frame per event: orjson encodes straight to bytes and
+    # StreamingResponse sends bytes as-is.
+    return b"event:" + event + b"\ndata:" + orjson.dumps(data) + b"\n\n"
 
 
 # --- Public endpoints ------------------------------------------------------
 
 
 @router.get("/{github_repo_id}/files", response_model=RepoFilesResponse)
-def list_repo_files(
+async def list_repo_files(
     github_repo_id: int = Path(..., ge=1),
-    db: Session = Depends(get_db),
-    user=Depends(current_user),
+    include_all: bool = Query(False, alias="all"),
+    gh=Depends(current_user_with_gh),
 ):
-    token = _get_user_github_token(db, user.id)
-    if not token:
-        raise HTTPException(status_code=401, detail="GitHub account not connected")
-    info = _get_repo_info_by_id(token, github_repo_id)
-    branch_name, head_sha = _resolve_branch_and_head(
-        token, info["owner"], info["name"], info["default_branch"]
+    """Tree files with their index status; ?all=1 includes files the indexer skips."""
+    _, token = gh
+    info = await _get_repo_info_by_id(token, github_repo_id)
+    # The indexed-paths query doesn't depend on GitHub: run it while the
+    # branch and tree requests are in flight.
+    (branch_name, _, entries), indexed = await asyncio.gather(
+        _get_head_tree(token, info),
+        _indexed_paths(info["owner"], info["name"]),
     )
-    entries = _get_tree_entries(token, info["owner"], info["name"], head_sha)
-    indexed = _indexed_paths(db, info["owner"], info["name"])
+    if not include_all:
+        entries = [e for e in entries if not _is_skipped(e.path)]
+    # Plain dicts: response_model validates and serializes them in one
+    # pydantic-core pass, cheaper than building a FileStatus per file first
+    # (model_construct measured slower still: it runs in Python).
     files = [
-        FileStatus(
-            path=e["path"],
-            status=("indexed" if e["path"] in indexed else "not-indexed"),
-        )
+        {"path": e.path, "status": ("indexed" if e.path in indexed else "not-indexed")}
         for e in entries
     ]
     info_out = {
@@ -207,47 +539,117 @@ def list_repo_files(
         "name": info["name"],
         "default_branch": branch_name,
     }
-    return RepoFilesResponse(repo=RepoInfo(**info_out), files=files)
+    return {"repo": info_out, "files": files}
 
 
 @router.get("/{github_repo_id}/files/summary")
-def files_summary(
+async def files_summary(
     github_repo_id: int,
-    db: Session = Depends(get_db),
-    user=Depends(current_user),
+    include_all: bool = Query(False, alias="all"),
+    gh=Depends(current_user_with_gh),
 ):
-    token = _get_user_github_token(db, user.id)
-    if not token:
-        raise HTTPException(status_code=401, detail="GitHub account not connected")
-    info = _get_repo_info_by_id(token, github_repo_id)
+    _, token = gh
+    info = await _get_repo_info_by_id(token, github_repo_id)
     try:
-        branch_name, head_sha = _resolve_branch_and_head(
-            token, info["owner"], info["name"], info["default_branch"]
-        )
-        entries = _get_tree_entries(token, info["owner"], info["name"], head_sha)
+        _, _, entries = await _get_head_tree(token, info)
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
             return {"repo": info, "counts": {"total": 0, "indexed": 0}}
         raise
-    indexed = _indexed_paths(db, info["owner"], info["name"])
+    if not include_all:
+        entries = [e for e in entries if not _is_skipped(e.path)]
     total = len(entries)
-    indexed_count = sum(1 for e in entries if e["path"] in indexed)
+    # Only the count is needed: no indexed path strings come back to Python.
+    indexed_count = await _indexed_count(info["owner"], info["name"], [e.path for e in entries])
     return {"repo": info, "counts": {"total": total, "indexed": indexed_count}}
 
 
+# --- Background index jobs -------------------------------------------------
+
+# Finished jobs stay subscribable this long, for late or reconnecting clients.
+INDEX_JOB_RETENTION = int(os.getenv("INDEX_JOB_RETENTION_S", "300"))
+
+
+class _IndexJob:
+    """
+    One indexing run, owned by the app rather than by a request. Its SSE
+    frames are kept in order, so every subscriber replays from the start and
+    then follows live, and none of them can slow the job down.
+    """
+
+    def __init__(self, user_id: int, repo_id: int, limit: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.repo_id = repo_id
+        self.limit = limit
+        self.events: List[bytes] = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, frame: bytes) -> None:
+        self.events.append(frame)
+        # Wake current followers; the next ones wait on a fresh event.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def finish(self) -> None:
+        self.done = True
+        self._changed.set()
+
+    async def follow(self):
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield _SSE_KEEPALIVE
+
+
+def _index_jobs(app) -> Dict[str, _IndexJob]:
+    jobs = getattr(app.state, "index_jobs", None)
+    if jobs is None:
+        jobs = app.state.index_jobs = {}
+    return jobs
+
+
+def _start_index_job(jobs: Dict[str, _IndexJob], job: _IndexJob, run_job) -> None:
+    async def main() -> None:
+        try:
+            await run_job(job)
+        except Exception as ex:
+            job.publish(_sse(b"error", {"message": str(ex)}))
+        finally:
+            job.finish()
+            asyncio.get_running_loop().call_later(INDEX_JOB_RETENTION, jobs.pop, job.id, None)
+
+    jobs[job.id] = job
+    job.task = asyncio.create_task(main())
+
+
+async def shutdown_index_jobs(app, timeout: float = 10) -> None:
+    """Cancel running index jobs and give them `timeout` s to flush their hashes."""
+    tasks = [j.task for j in _index_jobs(app).values() if j.task and not j.task.done()]
+    for t in tasks:
+        t.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+
+
 # --- Streaming real indexing (writes to DB) --------------------------------
 
 
-@router.get("/{github_repo_id}/index/stream")
-async def index_repo_stream(
-    github_repo_id: int,
-    limit: int = Query(50, ge=1, le=1000),
-    db: Session = Depends(get_db),
-    user=Depends(current_user),
-):
+async def _launch_index_job(
+    request: Request, github_repo_id: int, limit: int, user, token: str
+) -> _IndexJob:
     """
-    Streams real-time indexing progress via Server-Sent Events (SSE) and WRITES to DB.
-    Events:
+    Start indexing the repo as a background job, or return the user's job
+    already running for it. The job WRITES to DB and publishes SSE frames:
       - start            {repo, branch, head, counts}
       - file-start       {path, size_hint}
       - file-skip        {path, reason}
@@ -257,30 +659,78 @@ async def index_repo_stream(
       - progress         {considered, files_written, chunks_written, errors}
       - done             {summary}
       - error            {message}
+    Chunks and hashes are committed file by file, so a cancelled job loses
+    only the files in flight; the next run skips everything already indexed.
+    A running job is found before any GitHub or DB work: all of that runs in
+    the job, so re-attaching costs nothing and failures arrive as an error frame.
+    It is reused whatever `limit` it was started with (`job.limit`, also sent
+    as counts.limit in its start frame): two jobs would index the same files.
+    Ask again with another limit once it is done.
     """
-    token = _get_user_github_token(db, user.id)
-    if not token:
-        raise HTTPException(status_code=401, detail="GitHub account not connected")
 
-    info = _get_repo_info_by_id(token, github_repo_id)
-    branch_name, head_sha = _resolve_branch_and_head(
-        token, info["owner"], info["name"], info["default_branch"]
+    jobs = _index_jobs(request.app)
+    running = next(
+        (
+            j
+            for j in jobs.values()
+            if not j.done and j.user_id == user.id and j.repo_id == github_repo_id
+        ),
+        None,
     )
-    entries = _get_tree_entries(token, info["owner"], info["name"], head_sha)
-    indexed = _indexed_paths(db, info["owner"], info["name"])
+    if running is not None:
+        return running
+
+    async def run_job(job: _IndexJob) -> None:
+        info = await _get_repo_info_by_id(token, github_repo_id)
+        branch_name, head_sha = await _resolve_branch_and_head(
+            token, info["owner"], info["name"], info["default_branch"]
+        )
+        entries = await _get_tree_entries(token, info["owner"], info["name"], head_sha)
 
-    def is_skipped(path: str) -> bool:
-        ext = os.path.splitext(path)[1].lower()
-        return ext in SKIP_EXTS
+        wanted = [e for e in entries if not _is_skipped(e.path)]
 
-    candidates = [
-        e for e in entries if e["path"] not in indexed and not is_skipped(e["path"])
-    ]
-    to_index = candidates[:limit]
+        def pick() -> Tuple[List[TreeEntry], Dict[str, str], int]:
+            # The job outlives the request, so it can't use the request's Session.
+            with SessionLocal() as db:
+                return _not_indexed(db, info["owner"], info["name"], wanted, limit)
 
-    chunk_code, embed_texts = _load_indexer()
+        to_index, known_hashes, already_indexed = await asyncio.to_thread(pick)
+
+        chunk_code, embed_texts, _ = _load_indexer()
+        reusable = await asyncio.to_thread(blob_shas_with_chunks, [e.sha for e in to_index])
+        to_fetch, to_reuse = _split_reusable(to_index, reusable)
+        reuse_paths = {e.path for e in to_reuse}
+        # Set once the first file with a repeated SHA is done, so its copies can reuse it.
+        firsts_done = {
+            sha: asyncio.Event() for sha in {e.sha for e in to_reuse} if sha not in reusable
+        }
+
+        async def fetch_blobs(q: asyncio.Queue) -> None:
+            """
+            Download to_fetch blobs concurrently; queue (entry, (text, hash), error)
+            as each lands. Files whose chunks can be copied are queued last, unfetched.
+            """
+            sem = asyncio.Semaphore(BLOB_FETCH_CONCURRENCY)
+
+            async def fetch_one(e: TreeEntry) -> None:
+                try:
+                    async with sem:
+                        fetched = await _get_blob_text(
+                            token, info["owner"], info["name"], e.sha, e.size
+                        )
+                except Exception as ex:
+                    await q.put((e, None, ex))
+                else:
+                    # Bounded queue: fetching stalls once BLOB_PREFETCH blobs wait
+                    # on the indexer.
+                    await q.put((e, fetched, None))
+
+            await asyncio.gather(*(fetch_one(e) for e in to_fetch))
+            # Queued after every first occurrence, so a copy never waits on a file
+            # still behind it in the queue.
+            for e in to_reuse:
+                await q.put((e, None, None))
 
-    async def eventgen():
         # Initial: announce plan
         start_payload = {
             "repo": {
@@ -292,118 +742,162 @@ async def index_repo_stream(
             "head": head_sha,
             "counts": {
                 "total_candidates": len(entries),
-                "already_indexed": len(indexed),
+                "already_indexed": already_indexed,
                 "will_index": len(to_index),
                 "limit": limit,
             },
         }
-        yield f"event:start\ndata:{json.dumps(start_payload)}\n\n"
+        job.publish(_sse(b"start", start_payload))
 
-        files_written = 0
-        chunks_written = 0
-        errors = 0
-        considered = 0
+        counts = {"considered": 0, "files_written": 0, "chunks_written": 0, "errors": 0}
+        batcher = _EmbedBatcher(embed_texts)
 
-        for e in to_index:
-            path = e["path"]
-            size_hint = int(e.get("size") or 0)
-            considered += 1
-            # file-start
-            yield f"event:file-start\ndata:{json.dumps({'path': path, 'size_hint': size_hint})}\n\n"
+        # (path, content_hash, blob_sha) of unchanged files, whose new blob sha
+        # is stamped in one UPDATE at the end. Written files get theirs with
+        # their chunks.
+        hashed: List[Tuple[str, str, str]] = []
 
+        def flush_hashes() -> None:
             try:
-                blob = _get_blob_text(
-                    token, info["owner"], info["name"], e["sha"], e.get("size")
+                upsert_file_hashes(info["owner"], info["name"], hashed, head_sha)
+            except Exception:
+                # Only costs a re-fetch of these files next run: their content
+                # hash is still stored.
+                log.exception("stamping %d unchanged files failed", len(hashed))
+
+        def emit(event: bytes, data: Dict) -> None:
+            job.publish(_sse(event, data))
+
+        async def reuse_file(e: TreeEntry) -> bool:
+            """Copy the chunks of a file with the same blob; False if none has any."""
+            path = e.path
+            first = firsts_done.get(e.sha)
+            if first is not None:
+                await first.wait()
+            wrote = await asyncio.to_thread(
+                copy_blob_chunks, info["owner"], info["name"], path, e.sha, head_sha
+            )
+            if not wrote:
+                return False
+            counts["chunks_written"] += wrote
+            counts["files_written"] += 1
+            _invalidate_indexed(info["owner"], info["name"])
+            emit(b"file-written", {"path": path, "chunks_written": wrote, "reused": True})
+            return True
+
+        async def index_file(e: TreeEntry, fetched: Optional[Tuple[str, str]]) -> None:
+            path = e.path
+            if path in reuse_paths:
+                if await reuse_file(e):
+                    return
+                fetched = await _get_blob_text(
+                    token, info["owner"], info["name"], e.sha, e.size
                 )
-                if not blob:
-                    yield f"event:file-skip\ndata:{json.dumps({'path': path, 'reason': 'binary-or-large'})}\n\n"
-                    # progress
-                    yield f"event:progress\ndata:{json.dumps({'considered': considered, 'files_written': files_written, 'chunks_written': chunks_written, 'errors': errors})}\n\n"
-                    await asyncio.sleep(0)
-                    continue
-
-                # Chunk
-                chunks = chunk_code(blob) or []
-                if not chunks:
-                    yield f"event:file-skip\ndata:{json.dumps({'path': path, 'reason': 'no-chunks'})}\n\n"
-                    yield f"event:progress\ndata:{json.dumps({'considered': considered, 'files_written': files_written, 'chunks_written': chunks_written, 'errors': errors})}\n\n"
-                    await asyncio.sleep(0)
-                    continue
-
-                total_lines = blob.count("\n") + 1
-                total_chars = len(blob)
-                yield f"event:file-chunked\ndata:{json.dumps({'path': path, 'chunks': len(chunks), 'total_lines': total_lines, 'total_chars': total_chars})}\n\n"
-
-                # Embed
-                texts = [c["text"] for c in chunks]
-                vecs = embed_texts(texts)
-                if len(vecs) != len(chunks):
-                    raise RuntimeError(
-                        f"embed_texts returned {len(vecs)} vecs for {len(chunks)} chunks"
-                    )
-                yield f"event:file-embedded\ndata:{json.dumps({'path': path, 'embed_count': len(vecs)})}\n\n"
-
-                # Write all chunks
-                wrote_any = False
-                for ch, vec in zip(chunks, vecs):
-                    if len(vec) != EMBED_DIM:
-                        raise RuntimeError(
-                            f"bad embed dim={len(vec)} expected={EMBED_DIM}"
-                        )
-                    insert_chunk_with_vec(
-                        owner=info["owner"],
-                        name=info["name"],
-                        path=path,
-                        start_line=ch["start_line"],
-                        end_line=ch["end_line"],
-                        embedding=vec,
-                    )
-                    wrote_any = True
-                    chunks_written += 1
-                    # Give UI a heartbeat during large files
-                    if chunks_written % 50 == 0:
-                        yield f"event:progress\ndata:{json.dumps({'considered': considered, 'files_written': files_written, 'chunks_written': chunks_written, 'errors': errors})}\n\n"
-                        await asyncio.sleep(0)
-
-                if wrote_any:
-                    files_written += 1
-                    # best-effort per-file metadata update
-                    try:
-                        h = hashlib.sha1(
-                            blob.encode("utf-8", errors="ignore")
-                        ).hexdigest()
-                        with engine.begin() as conn:
-                            conn.execute(
-                                text(
-                                    """
-                                UPDATE files f SET commit = :commit, content_hash = :h
-                                FROM repos r
-                                WHERE f.repo_id = r.id
-                                  AND r.owner = :owner AND r.name = :name
-                                  AND f.path = :path
-                            """
-                                ),
-                                {
-                                    "commit": head_sha,
-                                    "h": h,
-                                    "owner": info["owner"],
-                                    "name": info["name"],
-                                    "path": path,
-                                },
-                            )
-                    except Exception:
-                        # Ignore metadata update errors in stream mode
-                        pass
-
-                yield f"event:file-written\ndata:{json.dumps({'path': path, 'chunks_written': len(chunks)})}\n\n"
+            if not fetched or not fetched[0]:
+                emit(b"file-skip", {"path": path, "reason": "binary-or-large"})
+                return
+            blob, h = fetched
+
+            # Same content as the stored hash => chunks are current, skip embedding
+            # and only record the new blob sha
+            if known_hashes.get(path) == h:
+                hashed.append((path, h, e.sha))
+                emit(b"file-skip", {"path": path, "reason": "unchanged"})
+                return
+
+            # Chunk
+            chunks = await asyncio.to_thread(chunk_code, blob) or []
+            if not chunks:
+                emit(b"file-skip", {"path": path, "reason": "no-chunks"})
+                return
+
+            total_lines = blob.count("\n") + 1
+            total_chars = len(blob)
+            emit(
+                b"file-chunked",
+                {
+                    "path": path,
+                    "chunks": len(chunks),
+                    "total_lines": total_lines,
+                    "total_chars": total_chars,
+                },
+            )
 
-            except Exception as ex:
-                errors += 1
-                yield f"event:error\ndata:{json.dumps({'path': path, 'message': str(ex)})}\n\n"
+            # Embed (batched with other files' chunks)
+            texts = [c["text"] for c in chunks]
+            vecs = await batcher.embed(texts)
+            if len(vecs) != len(chunks):
+                raise RuntimeError(
+                    f"embed_texts returned {len(vecs)} vecs for {len(chunks)} chunks"
+                )
+            emit(b"file-embedded", {"path": path, "embed_count": len(vecs)})
+
+            # Write all chunks of the file in one batch (validates EMBED_DIM)
+            spans = [(ch["start_line"], ch["end_line"], v) for ch, v in zip(chunks, vecs)]
+            # replace=True: drop any stale chunks of the file in the same tx
+            written = await asyncio.to_thread(
+                insert_chunks_with_vecs,
+                info["owner"],
+                info["name"],
+                [(path, spans)],
+                True,
+                {path: e.sha},
+                {path: h},
+                head_sha,
+            )
+            wrote = written["chunks"]
+            counts["chunks_written"] += wrote
 
-            # progress after each file
-            yield f"event:progress\ndata:{json.dumps({'considered': considered, 'files_written': files_written, 'chunks_written': chunks_written, 'errors': errors})}\n\n"
-            await asyncio.sleep(0)
+            if wrote:
+                counts["files_written"] += 1
+                _invalidate_indexed(info["owner"], info["name"])
+
+            emit(b"file-written", {"path": path, "chunks_written": wrote})
+
+        async def worker() -> None:
+            while (item := await blobs.get()) is not None:
+                e, fetched, fetch_error = item
+                path = e.path
+                counts["considered"] += 1
+                emit(b"file-start", {"path": path, "size_hint": int(e.size or 0)})
+                try:
+                    if fetch_error is not None:
+                        raise fetch_error
+                    await index_file(e, fetched)
+                except Exception as ex:
+                    counts["errors"] += 1
+                    emit(b"error", {"path": path, "message": str(ex)})
+                finally:
+                    first = firsts_done.get(e.sha)
+                    if first is not None and path not in reuse_paths:
+                        first.set()
+                # progress after each file
+                emit(b"progress", dict(counts))
+
+        async def run() -> None:
+            # Several files in flight so their chunks share embed batches.
+            workers = [asyncio.create_task(worker()) for _ in range(STREAM_FILES_IN_FLIGHT)]
+            try:
+                await fetch_blobs(blobs)
+                for _ in workers:
+                    await blobs.put(None)
+                await asyncio.gather(*workers)
+            except Exception as ex:
+                emit(b"error", {"message": str(ex)})
+            finally:
+                for w in workers:
+                    w.cancel()
+                # Runs on cancellation too, so written files keep their hashes.
+                await asyncio.to_thread(flush_hashes)
+
+        # Files arrive in completion order, not tree order; events of files in
+        # flight interleave. Hashing, chunking, embedding and DB writes run in
+        # threads so other requests keep being served while a repo indexes.
+        blobs: asyncio.Queue = asyncio.Queue(maxsize=BLOB_PREFETCH)
+        try:
+            await run()
+        finally:
+            await batcher.aclose()
 
         summary = {
             "repo": {
@@ -415,135 +909,183 @@ async def index_repo_stream(
             "head": head_sha,
             "counts": {
                 "considered": len(to_index),
-                "files_written": files_written,
-                "chunks_written": chunks_written,
-                "errors": errors,
+                "files_written": counts["files_written"],
+                "chunks_written": counts["chunks_written"],
+                "errors": counts["errors"],
             },
         }
-        yield f"event:done\ndata:{json.dumps(summary)}\n\n"
+        job.publish(_sse(b"done", summary))
+
+    job = _IndexJob(user.id, github_repo_id, limit)
+    _start_index_job(jobs, job, run_job)
+    return job
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@router.get("/{github_repo_id}/index/stream")
+async def index_repo_stream(
+    request: Request,
+    github_repo_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    gh=Depends(current_user_with_gh),
+):
+    """
+    Index the repo and stream its progress as Server-Sent Events. The work
+    runs as a background job: a client that disconnects stops listening, not
+    indexing, and calling again while it runs re-attaches to the same job,
+    even with a different `limit`; its start frame carries the one in effect.
+    """
+    job = await _launch_index_job(request, github_repo_id, limit, *gh)
+    return StreamingResponse(job.follow(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@router.post("/{github_repo_id}/index/jobs")
+async def start_index_job(
+    request: Request,
+    github_repo_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    gh=Depends(current_user_with_gh),
+):
+    """
+    Start (or find the running) index job; progress is at events_url. A running
+    job is returned as is, so `limit` is the one it was started with.
+    """
+    job = await _launch_index_job(request, github_repo_id, limit, *gh)
+    return {"job_id": job.id, "limit": job.limit, "events_url": f"/repos/jobs/{job.id}/events"}
 
-    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
-    return StreamingResponse(eventgen(), media_type="text/event-stream", headers=headers)
+
+@router.get("/jobs/{job_id}/events")
+async def index_job_events(job_id: str, request: Request, user=Depends(current_user)):
+    """SSE of an index job, replayed from its start event; any number of subscribers."""
+    job = _index_jobs(request.app).get(job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Index job not found")
+    return StreamingResponse(job.follow(), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
 # --- Non-stream fallback: batch indexing (writes to DB, returns JSON) ------
 
 
 @router.post("/{github_repo_id}/index")
-def index_repo_write(
+async def index_repo_write(
     github_repo_id: int,
     limit: int = Query(1000, ge=1, le=5000),
     db: Session = Depends(get_db),
-    user=Depends(current_user),
+    gh=Depends(current_user_with_gh),
 ):
     """
     REAL INDEXING (non-stream). Fetches, chunks, embeds, and WRITES to Postgres.
-    Uses insert_chunk_with_vec(), which validates vector size == EMBED_DIM.
+    Writes each file's chunks in one batch via insert_chunks_with_vecs(),
+    which validates vector size == EMBED_DIM.
     """
-    token = _get_user_github_token(db, user.id)
-    if not token:
-        raise HTTPException(status_code=401, detail="GitHub account not connected")
+    _, token = gh
 
-    info = _get_repo_info_by_id(token, github_repo_id)
-    branch_name, head_sha = _resolve_branch_and_head(
+    info = await _get_repo_info_by_id(token, github_repo_id)
+    branch_name, head_sha = await _resolve_branch_and_head(
         token, info["owner"], info["name"], info["default_branch"]
     )
-    entries = _get_tree_entries(token, info["owner"], info["name"], head_sha)
-    indexed = _indexed_paths(db, info["owner"], info["name"])
-
-    def is_skipped(path: str) -> bool:
-        ext = os.path.splitext(path)[1].lower()
-        return ext in SKIP_EXTS
-
-    candidates = [
-        e for e in entries if e["path"] not in indexed and not is_skipped(e["path"])
-    ]
-    to_index = candidates[:limit]
+    entries = await _get_tree_entries(token, info["owner"], info["name"], head_sha)
 
-    chunk_code, embed_texts = _load_indexer()
-
-    files_written = 0
-    chunks_written = 0
-    errors = 0
-    results = []
-
-    for e in to_index:
-        path = e["path"]
-        size_hint = int(e.get("size") or 0)
-        try:
-            blob = _get_blob_text(
-                token, info["owner"], info["name"], e["sha"], e.get("size")
-            )
-            if not blob:
-                results.append(
-                    {"path": path, "ok": True, "skipped": "binary-or-large"}
-                )
-                continue
-
-            chunks = chunk_code(blob) or []
-            if not chunks:
-                results.append({"path": path, "ok": True, "skipped": "no-chunks"})
-                continue
-
-            texts = [c["text"] for c in chunks]
-            vecs = embed_texts(texts)
-            if len(vecs) != len(chunks):
-                raise RuntimeError(
-                    f"embed_texts returned {len(vecs)} vecs for {len(chunks)} chunks"
-                )
+    wanted = [e for e in entries if not _is_skipped(e.path)]
+    to_index, known_hashes, already_indexed = await asyncio.to_thread(
+        _not_indexed, db, info["owner"], info["name"], wanted, limit
+    )
 
-            wrote_any = False
-            for ch, vec in zip(chunks, vecs):
-                if len(vec) != EMBED_DIM:
+    chunk_code, embed_texts, _ = _load_indexer()
+
+    reusable = await asyncio.to_thread(blob_shas_with_chunks, [e.sha for e in to_index])
+    to_fetch, to_reuse = _split_reusable(to_index, reusable)
+
+    def store(path: str, sha: str, h: str, chunks: List[Dict], vecs) -> int:
+        spans = [(ch["start_line"], ch["end_line"], v) for ch, v in zip(chunks, vecs)]
+        # The hash is stamped in the chunks' transaction, file by file.
+        return insert_chunks_with_vecs(
+            info["owner"],
+            info["name"],
+            [(path, spans)],
+            replace=True,
+            blob_shas={path: sha},
+            content_hashes={path: h},
+            commit=head_sha,
+        )["chunks"]
+
+    # (path, content_hash, blob_sha) of unchanged files, whose new blob sha is
+    # stamped in one UPDATE at the end.
+    hashed: List[Tuple[str, str, str]] = []
+    sem = asyncio.Semaphore(INDEX_CONCURRENCY)
+    in_flight = asyncio.Semaphore(STREAM_FILES_IN_FLIGHT)
+    batcher = _EmbedBatcher(embed_texts)
+
+    async def index_one(e: TreeEntry, reuse: bool = False) -> Tuple[Dict, int]:
+        """fetch -> hash -> chunk -> embed -> write for one file: (result, chunks_written)."""
+        path = e.path
+        size_hint = int(e.size or 0)
+        async with in_flight:
+            try:
+                async with sem:
+                    if reuse:
+                        wrote = await asyncio.to_thread(
+                            copy_blob_chunks, info["owner"], info["name"], path, e.sha, head_sha
+                        )
+                        if wrote:
+                            result = {"path": path, "ok": True, "chunks": wrote, "reused": True}
+                            return result, wrote
+                    fetched = await _get_blob_text(
+                        token, info["owner"], info["name"], e.sha, e.size
+                    )
+                    if not fetched or not fetched[0]:
+                        return {"path": path, "ok": True, "skipped": "binary-or-large"}, 0
+                    blob, h = fetched
+                    if known_hashes.get(path) == h:
+                        hashed.append((path, h, e.sha))
+                        return {"path": path, "ok": True, "skipped": "unchanged"}, 0
+
+                    chunks = await asyncio.to_thread(chunk_code, blob) or []
+                    if not chunks:
+                        return {"path": path, "ok": True, "skipped": "no-chunks"}, 0
+
+                # Not under sem: the chunks of every file in flight wait in the
+                # batcher together, so its batches fill instead of lingering.
+                texts = [c["text"] for c in chunks]
+                vecs = await batcher.embed(texts)
+                if len(vecs) != len(chunks):
                     raise RuntimeError(
-                        f"bad embed dim={len(vec)} expected={EMBED_DIM}"
+                        f"embed_texts returned {len(vecs)} vecs for {len(chunks)} chunks"
                     )
-                insert_chunk_with_vec(
-                    owner=info["owner"],
-                    name=info["name"],
-                    path=path,
-                    start_line=ch["start_line"],
-                    end_line=ch["end_line"],
-                    embedding=vec,
-                )
-                wrote_any = True
-                chunks_written += 1
 
-            if wrote_any:
-                files_written += 1
-                try:
-                    h = hashlib.sha1(
-                        blob.encode("utf-8", errors="ignore")
-                    ).hexdigest()
-                    with engine.begin() as conn:
-                        conn.execute(
-                            text(
-                                """
-                                UPDATE files f SET commit = :commit, content_hash = :h
-                                FROM repos r
-                                WHERE f.repo_id = r.id
-                                  AND r.owner = :owner AND r.name = :name
-                                  AND f.path = :path
-                            """
-                            ),
-                            {
-                                "commit": head_sha,
-                                "h": h,
-                                "owner": info["owner"],
-                                "name": info["name"],
-                                "path": path,
-                            },
-                        )
-                except Exception:
-                    pass
+                async with sem:
+                    wrote = await asyncio.to_thread(store, path, e.sha, h, chunks, vecs)
+                result = {"path": path, "ok": True, "chunks": len(chunks), "size_hint": size_hint}
+                return result, wrote
 
-            results.append(
-                {"path": path, "ok": True, "chunks": len(chunks), "size_hint": size_hint}
-            )
+            except Exception as ex:
+                return {"path": path, "ok": False, "error": str(ex)}, 0
 
-        except Exception as ex:
-            errors += 1
-            results.append({"path": path, "ok": False, "error": str(ex)})
+    # Files are independent: overlap GitHub fetches on the loop with chunking
+    # and DB writes in threads, at most INDEX_CONCURRENCY of those at once,
+    # while up to STREAM_FILES_IN_FLIGHT files share embed batches. Files
+    # repeating a blob go second, once the first copy of each is written, and
+    # copy its chunks.
+    try:
+        fetched_outcomes = await asyncio.gather(*(index_one(e) for e in to_fetch))
+        reused_outcomes = await asyncio.gather(*(index_one(e, reuse=True) for e in to_reuse))
+    finally:
+        await batcher.aclose()
+        _invalidate_indexed(info["owner"], info["name"])
+
+    try:
+        await asyncio.to_thread(upsert_file_hashes, info["owner"], info["name"], hashed, head_sha)
+    except Exception:
+        log.exception("stamping %d unchanged files failed", len(hashed))
+
+    by_path = {r["path"]: (r, n) for r, n in (*fetched_outcomes, *reused_outcomes)}
+    outcomes = [by_path[e.path] for e in to_index]
+    results = [r for r, _ in outcomes]
+    files_written = sum(1 for _, n in outcomes if n)
+    chunks_written = sum(n for _, n in outcomes)
+    errors = sum(1 for r in results if not r["ok"])
 
     summary = {
         "repo": {**info, "default_branch": branch_name, "head": head_sha},
@@ -561,50 +1103,51 @@ def index_repo_write(
 # --- Dangerous: drop all chunks for a repo --------------------------------
 
 
+_DELETE_REPO_CHUNKS_SQL = text(
+    """
+  DELETE FROM chunks c
+  USING files f, repos r
+  WHERE c.file_id = f.id
+    AND f.repo_id = r.id
+    AND r.owner = :owner
+    AND r.name  = :name
+"""
+)
+
+_RESET_REPO_FILES_SQL = text(
+    """
+  UPDATE files f
+  SET commit = NULL, content_hash = NULL, blob_sha = NULL
+  FROM repos r
+  WHERE f.repo_id = r.id
+    AND r.owner = :owner
+    AND r.name  = :name
+"""
+)
+
+
 @router.delete("/{github_repo_id}/index")
-def delete_repo_index(
+async def delete_repo_index(
     github_repo_id: int,
     db: Session = Depends(get_db),
-    user=Depends(current_user),
+    gh=Depends(current_user_with_gh),
 ):
     """
     Delete ALL chunks for this GitHub repo. Keeps repo/file rows,
-    but resets files.commit/content_hash so UI shows 0 indexed.
+    but resets files.commit/content_hash/blob_sha so UI shows 0 indexed.
     """
-    token = _get_user_github_token(db, user.id)
-    if not token:
-        raise HTTPException(status_code=401, detail="GitHub account not connected")
+    _, token = gh
 
-    info = _get_repo_info_by_id(token, github_repo_id)  # gives owner/name
+    info = await _get_repo_info_by_id(token, github_repo_id)  # gives owner/name
     params = {"owner": info["owner"], "name": info["name"]}
 
-    del_chunks = db.execute(
-        text(
-            """
-      DELETE FROM chunks c
-      USING files f, repos r
-      WHERE c.file_id = f.id
-        AND f.repo_id = r.id
-        AND r.owner = :owner
-        AND r.name  = :name
-    """
-        ),
-        params,
-    ).rowcount
-
-    db.execute(
-        text(
-            """
-      UPDATE files f
-      SET commit = NULL, content_hash = NULL
-      FROM repos r
-      WHERE f.repo_id = r.id
-        AND r.owner = :owner
-        AND r.name  = :name
-    """
-        ),
-        params,
-    )
+    def reset_index() -> int:
+        # Bulk DELETE can run for seconds on big repos; keep it off the event loop.
+        deleted = db.execute(_DELETE_REPO_CHUNKS_SQL, params).rowcount
+        db.execute(_RESET_REPO_FILES_SQL, params)
+        db.commit()
+        return deleted
 
-    db.commit()
+    del_chunks = await asyncio.to_thread(reset_index)
+    _invalidate_indexed(info["owner"], info["name"])
     return {"deleted_chunks": del_chunks, "repo": info}
@@ -0,0 +1,45 @@
+import os
+import uuid
+
+import pytest
+
+# app.db reads these at import. Nothing connects until a test does; tests
+# that need Postgres skip when DATABASE_URL isn't reachable, or fail with
+# REQUIRE_DB=1 (CI, where a silent skip would hide them).
+os.environ.setdefault("EMBED_DIM", "384")
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg://postgres@localhost/brain_test")
+os.environ.setdefault("EMBED_PRELOAD", "0")
+
+# Repos created by tests, removed again by the repo_name fixture.
+TEST_OWNER = "tests"
+
+
+@pytest.fixture(scope="session")
+def pg():
+    """app.db against a migrated Postgres (alembic upgrade head); skips without one."""
+    from sqlalchemy import text
+
+    from app import db
+
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT 1 FROM chunks LIMIT 0"))
+    except Exception as ex:
+        if os.getenv("REQUIRE_DB") == "1":
+            pytest.fail(f"REQUIRE_DB=1 but Postgres at DATABASE_URL isn't usable: {ex}")
+        pytest.skip(f"needs a migrated Postgres at DATABASE_URL: {ex}")
+    return db
+
+
+@pytest.fixture
+def repo_name(pg):
+    """A fresh repo name under TEST_OWNER; the repo and its files are deleted afterwards."""
+    from sqlalchemy import text
+
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    yield name
+    with pg.engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM repos WHERE owner = :owner AND name = :name"),
+            {"owner": TEST_OWNER, "name": name},
+        )
@@ -0,0 +1,130 @@
+import uuid
+
+import numpy as np
+import pytest
+from pgvector import HalfVector
+from sqlalchemy import text
+
+from app import db
+from conftest import TEST_OWNER as OWNER
+
+_FILE_SQL = text("""
+    SELECT f.path, f.commit, f.content_hash, f.blob_sha,
+           (SELECT count(*) FROM chunks c WHERE c.file_id = f.id) AS chunks
+    FROM files f
+    JOIN repos r ON r.id = f.repo_id
+    WHERE r.owner = :owner AND r.name = :name
+    ORDER BY f.path
+""")
+
+
+def _files(pg, name):
+    with pg.engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(_FILE_SQL, {"owner": OWNER, "name": name})]
+
+
+def _vec(pg, x=0.1):
+    return np.full(pg.EMBED_DIM, x, dtype=np.float32)
+
+
+def test_hash_and_commit_are_stamped_with_the_chunks(pg, repo_name):
+    pg.insert_chunks_with_vecs(
+        OWNER,
+        repo_name,
+        [("a.py", [(1, 2, _vec(pg)), (3, 4, _vec(pg))]), ("b.py", [(1, 2, _vec(pg))])],
+        replace=True,
+        blob_shas={"a.py": "A1", "b.py": "B1"},
+        content_hashes={"a.py": "hash-a", "b.py": "hash-b"},
+        commit="c1",
+    )
+    assert _files(pg, repo_name) == [
+        ("a.py", "c1", "hash-a", "A1", 2),
+        ("b.py", "c1", "hash-b", "B1", 1),
+    ]
+
+
+def test_rewriting_chunks_without_a_hash_clears_the_stale_one(pg, repo_name):
+    files = [("a.py", [(1, 2, _vec(pg))])]
+    pg.insert_chunks_with_vecs(
+        OWNER, repo_name, files, blob_shas={"a.py": "A1"}, content_hashes={"a.py": "h1"}
+    )
+    pg.insert_chunks_with_vecs(OWNER, repo_name, files, replace=True)
+    # New chunks from unknown content: neither the old hash nor blob describes them.
+    assert _files(pg, repo_name) == [("a.py", None, None, None, 1)]
+
+
+def test_upsert_file_hashes_stamps_existing_files_only(pg, repo_name):
+    pg.insert_chunks_with_vecs(OWNER, repo_name, [("a.py", [(1, 2, _vec(pg))])])
+    stamped = pg.upsert_file_hashes(
+        OWNER, repo_name, [("a.py", "hash-a", "A2"), ("missing.py", "h", "M1")], "c2"
+    )
+    assert stamped == 1
+    assert _files(pg, repo_name) == [("a.py", "c2", "hash-a", "A2", 1)]
+
+
+def _embeddings(pg, name, path):
+    sql = text("""
+        SELECT c.embedding FROM chunks c
+        JOIN files f ON f.id = c.file_id
+        JOIN repos r ON r.id = f.repo_id
+        WHERE r.owner = :owner AND r.name = :name AND f.path = :path
+        ORDER BY c.start_line
+    """)
+    with pg.engine.connect() as conn:
+        rows = conn.execute(sql, {"owner": OWNER, "name": name, "path": path}).scalars()
+        return [v.to_numpy() for v in rows]
+
+
+def test_vec_param_returns_a_halfvec_of_the_right_shape():
+    vec = db._vec_param([0.5] * db.EMBED_DIM)
+    assert isinstance(vec, HalfVector)
+    assert vec.to_numpy().shape == (db.EMBED_DIM,)
+    with pytest.raises(ValueError, match="shape"):
+        db._vec_param([0.5] * (db.EMBED_DIM - 1))
+    with pytest.raises(ValueError, match="shape"):
+        db._vec_param(np.zeros((2, db.EMBED_DIM), dtype=np.float32))
+
+
+def test_bulk_copy_round_trips_embeddings_as_halfvec(pg, repo_name):
+    rng = np.random.default_rng(3)
+    vecs = rng.standard_normal((3, pg.EMBED_DIM)).astype(np.float32)
+    rows = [
+        {"path": "a.py", "start_line": i, "end_line": i + 1, "embedding": v}
+        for i, v in enumerate(vecs)
+    ]
+    # A list of floats goes through the same COPY as the embedder's arrays.
+    rows.append({"path": "b.py", "start_line": 1, "end_line": 2, "embedding": vecs[0].tolist()})
+    out = pg.insert_chunks_bulk(OWNER, repo_name, rows)
+    assert (out["files"], out["chunks"]) == (2, 4)
+    stored = _embeddings(pg, repo_name, "a.py")
+    np.testing.assert_array_equal(np.array(stored), vecs.astype(np.float16))
+    np.testing.assert_array_equal(_embeddings(pg, repo_name, "b.py")[0], stored[0])
+
+
+def test_copy_blob_chunks_reuses_the_chunks_of_the_same_blob(pg, repo_name):
+    sha = uuid.uuid4().hex
+    pg.insert_chunks_with_vecs(
+        OWNER,
+        repo_name,
+        [("a.py", [(1, 2, _vec(pg, 0.1)), (3, 4, _vec(pg, 0.2))])],
+        blob_shas={"a.py": sha},
+        content_hashes={"a.py": "hash-a"},
+        commit="c1",
+    )
+    # b.py's old chunks are replaced by a.py's, embeddings included.
+    pg.insert_chunks_with_vecs(OWNER, repo_name, [("b.py", [(9, 9, _vec(pg, 0.9))])])
+    assert pg.copy_blob_chunks(OWNER, repo_name, "b.py", sha, "c2") == 2
+    assert _files(pg, repo_name) == [
+        ("a.py", "c1", "hash-a", sha, 2),
+        ("b.py", "c2", "hash-a", sha, 2),
+    ]
+    np.testing.assert_array_equal(
+        _embeddings(pg, repo_name, "b.py"), _embeddings(pg, repo_name, "a.py")
+    )
+
+
+def test_copy_blob_chunks_without_a_source_copies_nothing(pg, repo_name):
+    pg.insert_chunks_with_vecs(OWNER, repo_name, [("b.py", [(1, 2, _vec(pg))])])
+    assert pg.copy_blob_chunks(OWNER, repo_name, "b.py", uuid.uuid4().hex, "c2") == 0
+    # The caller embeds instead; the file's chunks are left as they were.
+    assert _files(pg, repo_name) == [("b.py", None, None, None, 1)]
@@ -0,0 +1,31 @@
+import codecs
+
+from app import repos
+
+
+def test_utf8_text_decodes():
+    assert repos._decode_blob("print('héllo')\n".encode()) == "print('héllo')\n"
+
+
+def test_nul_byte_near_the_start_is_binary():
+    assert repos._decode_blob(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + b"x" * 200) is None
+
+
+def test_nul_past_the_sniff_window_is_not_sniffed():
+    raw = b"a" * repos._SNIFF_BYTES + b"\x00"
+    assert repos._decode_blob(raw) == raw.decode()
+
+
+def test_utf16_with_bom_decodes():
+    text = "def f():\n    return 1\n"
+    assert repos._decode_blob(codecs.BOM_UTF16_LE + text.encode("utf-16-le")) == text
+    assert repos._decode_blob(codecs.BOM_UTF16_BE + text.encode("utf-16-be")) == text
+
+
+def test_utf16_without_bom_is_recognised_by_its_nuls():
+    text = "hello world, this is utf-16\n"
+    assert repos._decode_blob(text.encode("utf-16-le")) == text
+
+
+def test_undecodable_bytes_are_binary():
+    assert repos._decode_blob(b"\xc3\x28" * 10) is None
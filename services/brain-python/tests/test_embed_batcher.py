@@ -0,0 +1,93 @@
+import asyncio
+
+from app import repos
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_calls_share_batches_and_get_their_own_slices(monkeypatch):
+    monkeypatch.setattr(repos, "EMBED_COALESCE", 4)
+    monkeypatch.setattr(repos, "EMBED_LINGER", 0.2)
+    calls = []
+
+    def embed_texts(texts):
+        calls.append(list(texts))
+        return [f"vec:{t}" for t in texts]
+
+    async def main():
+        batcher = repos._EmbedBatcher(embed_texts)
+        try:
+            return await asyncio.gather(
+                batcher.embed(["a1", "a2"]),
+                batcher.embed(["b1", "b2"]),
+                batcher.embed(["c1", "c2", "c3"]),
+            )
+        finally:
+            await batcher.aclose()
+
+    results = _run(main())
+
+    # The first two calls fill a batch of EMBED_COALESCE; the third goes next.
+    assert calls == [["a1", "a2", "b1", "b2"], ["c1", "c2", "c3"]]
+    assert results == [
+        ["vec:a1", "vec:a2"],
+        ["vec:b1", "vec:b2"],
+        ["vec:c1", "vec:c2", "vec:c3"],
+    ]
+
+
+def test_partial_batch_is_sent_after_the_linger(monkeypatch):
+    monkeypatch.setattr(repos, "EMBED_COALESCE", 64)
+    monkeypatch.setattr(repos, "EMBED_LINGER", 0.01)
+
+    async def main():
+        batcher = repos._EmbedBatcher(lambda texts: [len(t) for t in texts])
+        try:
+            return await asyncio.wait_for(batcher.embed(["abc"]), 1)
+        finally:
+            await batcher.aclose()
+
+    assert _run(main()) == [3]
+
+
+def test_embed_error_reaches_every_waiter_of_the_batch(monkeypatch):
+    monkeypatch.setattr(repos, "EMBED_COALESCE", 64)
+    monkeypatch.setattr(repos, "EMBED_LINGER", 0.05)
+    fail = [True]
+
+    def embed_texts(texts):
+        if fail[0]:
+            raise RuntimeError("model down")
+        return [0.0] * len(texts)
+
+    async def main():
+        batcher = repos._EmbedBatcher(embed_texts)
+        try:
+            outcomes = await asyncio.gather(
+                batcher.embed(["a"]), batcher.embed(["b", "c"]), return_exceptions=True
+            )
+            # The batcher keeps serving after a failed batch.
+            fail[0] = False
+            after = await batcher.embed(["d"])
+            return outcomes, after
+        finally:
+            await batcher.aclose()
+
+    outcomes, after = _run(main())
+    assert len(outcomes) == 2
+    for ex in outcomes:
+        assert isinstance(ex, RuntimeError)
+        assert str(ex) == "model down"
+    assert after == [0.0]
+
+
+def test_aclose_stops_the_batching_task():
+    async def main():
+        batcher = repos._EmbedBatcher(lambda texts: texts)
+        await batcher.aclose()
+        return batcher._task
+
+    task = _run(main())
+    assert task.cancelled()
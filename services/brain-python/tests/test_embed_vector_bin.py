@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+PARAMS = {"owner": "tests", "name": "bin", "path": "a.py"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    inserted = []
+
+    def insert(owner, name, path, start_line, end_line, vec):
+        inserted.append(np.array(vec))
+        return {"repo_id": 1, "file_id": 1, "chunk_id": 1}
+
+    monkeypatch.setattr(main, "insert_chunk_with_vec", insert)
+    # No `with`: the lifespan (model preload, DB probe) isn't needed here.
+    c = TestClient(main.app)
+    c.inserted = inserted
+    return c
+
+
+def _post(client, vec):
+    return client.post(
+        "/embed-vector-bin",
+        params=PARAMS,
+        content=np.asarray(vec, dtype="<f4").tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+
+def test_accepts_a_float32_vector(client):
+    vec = np.linspace(-1, 1, main.EMBED_DIM, dtype=np.float32)
+    assert _post(client, vec).status_code == 200
+    np.testing.assert_array_equal(client.inserted[0], vec)
+
+
+def test_rejects_a_wrong_length_body(client):
+    assert _post(client, np.zeros(main.EMBED_DIM - 1)).status_code == 422
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, 70000.0, -1e6])
+def test_rejects_values_halfvec_cannot_hold(client, bad):
+    vec = np.zeros(main.EMBED_DIM, dtype=np.float32)
+    vec[3] = bad
+    assert _post(client, vec).status_code == 422
+    assert client.inserted == []
+
+
+def test_halfvec_max_itself_is_accepted(client):
+    vec = np.zeros(main.EMBED_DIM, dtype=np.float32)
+    vec[0] = np.finfo(np.float16).max
+    assert _post(client, vec).status_code == 200
@@ -0,0 +1,76 @@
+import asyncio
+from collections import OrderedDict
+
+import httpx
+import orjson
+import pytest
+
+from app.clients import github as gh
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """A fake GitHub: each URL has an ETag and a body; If-None-Match hits get a 304."""
+    state = {"requests": [], "etags": {}, "bodies": {}}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        state["requests"].append((path, request.headers.get("If-None-Match")))
+        etag = state["etags"].get(path, f'"{path}-1"')
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        body = state["bodies"].get(path, {"path": path, "etag": etag})
+        return httpx.Response(200, headers={"ETag": etag}, content=orjson.dumps(body))
+
+    client = httpx.AsyncClient(base_url=gh.GITHUB_API, transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(gh, "_client", client)
+    monkeypatch.setattr(gh, "_etag_cache", OrderedDict())
+    return state
+
+
+def _get(token, url):
+    return asyncio.run(gh.gh_get_conditional(token, url))
+
+
+def test_304_returns_the_cached_body(api):
+    first = _get("tok", "/repositories/1")
+    second = _get("tok", "/repositories/1")
+    assert second == first
+    assert api["requests"] == [
+        ("/repositories/1", None),
+        ("/repositories/1", '"/repositories/1-1"'),
+    ]
+
+
+def test_a_changed_resource_replaces_the_cached_body(api):
+    _get("tok", "/repositories/1")
+    api["etags"]["/repositories/1"] = '"v2"'
+    api["bodies"]["/repositories/1"] = {"changed": True}
+    assert _get("tok", "/repositories/1") == {"changed": True}
+    assert gh._etag_cache[("tok", "/repositories/1")] == ('"v2"', {"changed": True})
+
+
+def test_cache_is_per_token(api):
+    _get("a", "/repositories/1")
+    _get("b", "/repositories/1")
+    # b's first request isn't conditional on a's ETag.
+    assert [inm for _, inm in api["requests"]] == [None, None]
+
+
+def test_cache_evicts_the_least_recently_used(api, monkeypatch):
+    monkeypatch.setattr(gh, "_ETAG_CACHE_MAX", 2)
+    _get("tok", "/r/1")
+    _get("tok", "/r/2")
+    _get("tok", "/r/1")  # 304: /r/1 is now the most recent
+    _get("tok", "/r/3")
+    assert list(gh._etag_cache) == [("tok", "/r/1"), ("tok", "/r/3")]
+
+
+def test_errors_are_raised_and_not_cached(monkeypatch):
+    transport = httpx.MockTransport(lambda request: httpx.Response(404))
+    client = httpx.AsyncClient(base_url=gh.GITHUB_API, transport=transport)
+    monkeypatch.setattr(gh, "_client", client)
+    monkeypatch.setattr(gh, "_etag_cache", OrderedDict())
+    with pytest.raises(httpx.HTTPStatusError):
+        _get("tok", "/repositories/1")
+    assert gh._etag_cache == OrderedDict()
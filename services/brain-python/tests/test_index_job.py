@@ -0,0 +1,146 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import repos
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _take(agen, n):
+    out = []
+    async for frame in agen:
+        out.append(frame)
+        if len(out) == n:
+            break
+    return out
+
+
+async def _collect(agen):
+    return [frame async for frame in agen]
+
+
+def test_follow_replays_then_follows_live():
+    async def main():
+        job = repos._IndexJob(1, 42, 50)
+        job.publish(b"a")
+        job.publish(b"b")
+        follower = asyncio.create_task(_take(job.follow(), 4))
+        await asyncio.sleep(0)
+        job.publish(b"c")
+        job.publish(b"d")
+        job.finish()
+        return await follower
+
+    assert _run(main()) == [b"a", b"b", b"c", b"d"]
+
+
+def test_reconnect_replays_from_the_start():
+    async def main():
+        job = repos._IndexJob(1, 42, 50)
+        job.publish(b"start")
+        # First client reads one frame, then disconnects.
+        first = job.follow()
+        assert await first.__anext__() == b"start"
+        await first.aclose()
+
+        job.publish(b"progress")
+        second = asyncio.create_task(_collect(job.follow()))
+        await asyncio.sleep(0)
+        job.publish(b"done")
+        job.finish()
+        late = await _collect(job.follow())
+        return await second, late
+
+    second, late = _run(main())
+    assert second == [b"start", b"progress", b"done"]
+    assert late == [b"start", b"progress", b"done"]
+
+
+def test_follow_sends_keepalives_while_idle(monkeypatch):
+    monkeypatch.setattr(repos, "SSE_HEARTBEAT", 0.01)
+
+    async def main():
+        job = repos._IndexJob(1, 42, 50)
+        frames = await _take(job.follow(), 2)
+        job.finish()
+        return frames
+
+    assert _run(main()) == [repos._SSE_KEEPALIVE, repos._SSE_KEEPALIVE]
+
+
+def test_started_job_reports_errors_and_is_dropped_after_retention(monkeypatch):
+    monkeypatch.setattr(repos, "INDEX_JOB_RETENTION", 0)
+
+    async def run_job(job):
+        job.publish(b"start")
+        raise RuntimeError("boom")
+
+    async def main():
+        jobs = {}
+        job = repos._IndexJob(1, 42, 50)
+        repos._start_index_job(jobs, job, run_job)
+        assert jobs == {job.id: job}
+        frames = await _collect(job.follow())
+        await asyncio.sleep(0.01)
+        return job, frames, jobs
+
+    job, frames, jobs = _run(main())
+    assert job.done
+    assert frames[0] == b"start"
+    assert frames[1].startswith(b"event:error\n") and b"boom" in frames[1]
+    assert jobs == {}
+
+
+def test_launch_returns_the_running_job_without_any_prep(monkeypatch):
+    async def no_github(*args, **kwargs):
+        raise AssertionError("re-attaching must not call GitHub")
+
+    monkeypatch.setattr(repos, "_get_repo_info_by_id", no_github)
+
+    async def main():
+        request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace()))
+        jobs = repos._index_jobs(request.app)
+        running = repos._IndexJob(7, 42, 50)
+        jobs[running.id] = running
+        user = SimpleNamespace(id=7)
+        return running, await repos._launch_index_job(request, 42, 50, user, "tok")
+
+    running, got = _run(main())
+    assert got is running
+
+
+def test_launch_reuses_the_running_job_whatever_its_limit(monkeypatch):
+    async def no_github(*args, **kwargs):
+        raise AssertionError("re-attaching must not call GitHub")
+
+    monkeypatch.setattr(repos, "_get_repo_info_by_id", no_github)
+
+    async def main():
+        request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace()))
+        jobs = repos._index_jobs(request.app)
+        running = repos._IndexJob(7, 42, 50)
+        jobs[running.id] = running
+        user = SimpleNamespace(id=7)
+        return running, await repos._launch_index_job(request, 42, 500, user, "tok")
+
+    running, got = _run(main())
+    # Not a second job over the same files: the caller sees the limit in effect.
+    assert got is running
+    assert got.limit == 50
+
+
+def test_shutdown_cancels_running_jobs():
+    async def main():
+        app = SimpleNamespace(state=SimpleNamespace())
+        jobs = repos._index_jobs(app)
+        job = repos._IndexJob(1, 42, 50)
+        repos._start_index_job(jobs, job, lambda job: asyncio.sleep(60))
+        await asyncio.sleep(0)
+        await repos.shutdown_index_jobs(app, timeout=1)
+        return job
+
+    job = _run(main())
+    assert job.task.cancelled()
+    assert job.done
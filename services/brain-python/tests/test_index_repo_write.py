@@ -0,0 +1,108 @@
+import asyncio
+
+from app import repos
+
+FILES = [repos.TreeEntry(f"src/f{i:02}.py", f"sha{i}", 10) for i in range(16)]
+
+
+def _stub_repo(monkeypatch, embed_texts, written):
+    async def info(token, repo_id):
+        return {"github_id": repo_id, "owner": "o", "name": "n", "default_branch": "main"}
+
+    async def head(token, owner, name, branch):
+        return "main", "head"
+
+    async def tree(token, owner, name, sha):
+        return FILES
+
+    async def blob(token, owner, name, sha, size):
+        await asyncio.sleep(0.001)
+        return f"text of {sha}", f"hash-{sha}"
+
+    def chunk_code(text):
+        return [{"start_line": 1, "end_line": 2, "text": text}]
+
+    def insert(owner, name, files, replace=False, blob_shas=None, content_hashes=None, commit=None):
+        assert content_hashes == {path: f"hash-{blob_shas[path]}" for path, _ in files}
+        assert commit == "head"
+        written.extend(path for path, _ in files)
+        return {"chunks": sum(len(spans) for _, spans in files)}
+
+    monkeypatch.setattr(repos, "_get_repo_info_by_id", info)
+    monkeypatch.setattr(repos, "_resolve_branch_and_head", head)
+    monkeypatch.setattr(repos, "_get_tree_entries", tree)
+    monkeypatch.setattr(repos, "_get_blob_text", blob)
+    monkeypatch.setattr(repos, "_not_indexed", lambda db, o, n, entries, limit: (entries, {}, 0))
+    monkeypatch.setattr(repos, "_load_indexer", lambda: (chunk_code, embed_texts, None))
+    monkeypatch.setattr(repos, "blob_shas_with_chunks", lambda shas: set())
+    monkeypatch.setattr(repos, "insert_chunks_with_vecs", insert)
+    monkeypatch.setattr(repos, "upsert_file_hashes", lambda *args: len(args[2]))
+
+
+def test_files_in_flight_share_embed_batches_beyond_index_concurrency(monkeypatch):
+    monkeypatch.setattr(repos, "INDEX_CONCURRENCY", 4)
+    monkeypatch.setattr(repos, "STREAM_FILES_IN_FLIGHT", 16)
+    monkeypatch.setattr(repos, "EMBED_COALESCE", 16)
+    # Long enough that a partial batch would be noticed: only a full one goes early.
+    monkeypatch.setattr(repos, "EMBED_LINGER", 5)
+    batches = []
+    written = []
+
+    def embed_texts(texts):
+        batches.append(len(texts))
+        return [[0.0] for _ in texts]
+
+    _stub_repo(monkeypatch, embed_texts, written)
+
+    summary = asyncio.run(
+        asyncio.wait_for(repos.index_repo_write(1, limit=1000, db=None, gh=(None, "tok")), 4)
+    )
+
+    # All 16 one-chunk files were embedded in a single model call, not in
+    # INDEX_CONCURRENCY-sized batches each waiting out the linger.
+    assert batches == [16]
+    assert summary["counts"] == {
+        "considered": 16,
+        "files_written": 16,
+        "chunks_written": 16,
+        "errors": 0,
+    }
+    assert sorted(written) == [e.path for e in FILES]
+
+
+def test_embed_error_fails_only_the_files_of_that_batch(monkeypatch):
+    monkeypatch.setattr(repos, "STREAM_FILES_IN_FLIGHT", 16)
+    monkeypatch.setattr(repos, "EMBED_COALESCE", 64)
+    monkeypatch.setattr(repos, "EMBED_LINGER", 0.05)
+    written = []
+
+    def embed_texts(texts):
+        raise RuntimeError("model down")
+
+    _stub_repo(monkeypatch, embed_texts, written)
+
+    summary = asyncio.run(repos.index_repo_write(1, limit=1000, db=None, gh=(None, "tok")))
+
+    assert summary["counts"]["errors"] == 16
+    assert {r["error"] for r in summary["results"]} == {"model down"}
+    assert written == []
+
+
+def test_failed_stamp_of_unchanged_files_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(repos, "EMBED_LINGER", 0.01)
+    written = []
+    _stub_repo(monkeypatch, lambda texts: [[0.0] for _ in texts], written)
+    # Every file's text matches its stored hash.
+    known = {e.path: f"hash-{e.sha}" for e in FILES}
+    monkeypatch.setattr(repos, "_not_indexed", lambda db, o, n, entries, limit: (entries, known, 0))
+
+    def fail(*args):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(repos, "upsert_file_hashes", fail)
+
+    summary = asyncio.run(repos.index_repo_write(1, limit=1000, db=None, gh=(None, "tok")))
+
+    assert {r["skipped"] for r in summary["results"]} == {"unchanged"}
+    assert written == []
+    assert "stamping 16 unchanged files failed" in caplog.text
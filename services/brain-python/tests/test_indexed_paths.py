@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app import repos
+from conftest import TEST_OWNER as OWNER
+
+
+@pytest.fixture
+def repo(pg, repo_name, monkeypatch):
+    monkeypatch.setattr(repos, "_indexed_cache", type(repos._indexed_cache)())
+    vec = np.full(pg.EMBED_DIM, 0.1, dtype=np.float32)
+    pg.insert_chunks_with_vecs(OWNER, repo_name, [("a.py", [(1, 2, vec)]), ("b.py", [(1, 2, vec)])])
+    return repo_name
+
+
+def test_indexed_paths_queries_then_caches(repo):
+    assert asyncio.run(repos._indexed_paths(OWNER, repo)) == {"a.py", "b.py"}
+    assert repos._indexed_cache[(OWNER, repo)][1] == {"a.py", "b.py"}
+
+
+def test_indexed_count_counts_in_postgres(repo):
+    count = asyncio.run(repos._indexed_count(OWNER, repo, ["a.py", "c.py", "b.py"]))
+    assert count == 2
+    # Counting alone doesn't fill the path cache.
+    assert (OWNER, repo) not in repos._indexed_cache
+
+
+def test_indexed_count_uses_a_fresh_cache_entry(monkeypatch):
+    monkeypatch.setattr(repos, "_indexed_cache", type(repos._indexed_cache)())
+    repos._indexed_cache[(OWNER, "cached")] = (time.monotonic(), {"a.py"})
+
+    def no_query(*args):
+        raise AssertionError("a fresh cache entry must not hit Postgres")
+
+    monkeypatch.setattr(repos, "_query_indexed_count", no_query)
+    assert asyncio.run(repos._indexed_count(OWNER, "cached", ["a.py", "b.py"])) == 1
+    assert asyncio.run(repos._indexed_count(OWNER, "cached", [])) == 0
@@ -0,0 +1,56 @@
+import re
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from conftest import TEST_OWNER as OWNER
+
+
+@pytest.fixture
+def vecs(pg, repo_name):
+    rng = np.random.default_rng(7)
+    vecs = rng.random((6, pg.EMBED_DIM)).astype(np.float32)
+    pg.insert_chunks_with_vecs(
+        OWNER, repo_name, [(f"v{i}.py", [(i, i + 1, v)]) for i, v in enumerate(vecs)]
+    )
+    return vecs
+
+
+def test_knn_paths_orders_by_cosine_distance(pg, vecs):
+    rows = pg.knn_paths(vecs[2], k=3)
+    assert rows[0]["path"] == "v2.py"
+    assert rows[0]["dist"] == pytest.approx(0, abs=1e-3)
+    assert [r["dist"] for r in rows] == sorted(r["dist"] for r in rows)
+
+
+def test_knn_from_last_starts_at_the_newest_chunk(pg, vecs):
+    rows = pg.knn_from_last(3)
+    assert rows[0]["path"] == "v5.py"
+    assert rows[0]["dist"] == pytest.approx(0, abs=1e-3)
+
+
+def test_knn_from_last_runs_the_subquery_once_on_the_hnsw_index(pg, vecs):
+    with pg.engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = "\n".join(
+            row[0]
+            for row in conn.execute(text("EXPLAIN " + pg._KNN_FROM_LAST_SQL.text), {"k": 3})
+        )
+    assert set(re.findall(r"InitPlan \d+", plan)) == {"InitPlan 1"}
+    assert "idx_chunks_embedding_hnsw" in plan
+
+
+def test_knn_paths_iter_streams_and_releases_its_connection(pg, vecs, monkeypatch):
+    monkeypatch.setattr(pg, "_KNN_STREAM_BATCH", 2)
+    checked_out = pg.engine.pool.checkedout()
+    with pg.knn_paths_iter(vecs[0], k=5) as rows:
+        assert pg.engine.pool.checkedout() == checked_out + 1
+        first = next(rows)
+    # Left after one row: the connection still goes back to the pool.
+    assert pg.engine.pool.checkedout() == checked_out
+    assert first["path"] == "v0.py"
+
+    with pg.knn_paths_iter(vecs[0], k=5) as rows:
+        assert len(list(rows)) == 5
+    assert pg.engine.pool.checkedout() == checked_out
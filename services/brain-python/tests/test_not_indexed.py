@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from app import repos
+from conftest import TEST_OWNER as OWNER
+
+
+@pytest.fixture
+def session(pg):
+    with pg.SessionLocal() as s:
+        yield s
+
+
+@pytest.fixture
+def repo(pg, repo_name):
+    """A repo whose tree is a..e: a is indexed at its tree blob, b has chunks
+    from an older blob, c has a files row but no chunks, d and e are new."""
+    name = repo_name
+    vec = np.full(pg.EMBED_DIM, 0.1, dtype=np.float32)
+    pg.insert_chunks_with_vecs(
+        OWNER,
+        name,
+        [("a.py", [(1, 2, vec)]), ("b.py", [(1, 2, vec)]), ("c.py", [(1, 2, vec)])],
+        blob_shas={"a.py": "A1", "b.py": "B1", "c.py": "C1"},
+        content_hashes={"b.py": "hash-b"},
+    )
+    with pg.engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM chunks WHERE file_id IN (SELECT f.id FROM files f"
+                " JOIN repos r ON r.id = f.repo_id"
+                " WHERE r.owner = :owner AND r.name = :name AND f.path = 'c.py')"
+            ),
+            {"owner": OWNER, "name": name},
+        )
+    return name
+
+
+TREE = [
+    repos.TreeEntry("a.py", "A1", 1),
+    repos.TreeEntry("b.py", "B2", 1),
+    repos.TreeEntry("c.py", "C1", 1),
+    repos.TreeEntry("d.py", "D1", 1),
+    repos.TreeEntry("e.py", "E1", 1),
+]
+
+
+def test_limit_keeps_tree_order_and_counts_all_pending(session, repo):
+    to_index, stored, already = repos._not_indexed(session, OWNER, repo, TREE, 2)
+
+    assert [e.path for e in to_index] == ["b.py", "c.py"]
+    # Stale b.py comes back with its stored hash for the "unchanged" check.
+    assert stored == {"b.py": "hash-b"}
+    # Only a.py is indexed at its tree blob, however small the limit.
+    assert already == 1
+
+
+def test_everything_pending_within_the_limit(session, repo):
+    to_index, stored, already = repos._not_indexed(session, OWNER, repo, TREE, 100)
+
+    assert [e.path for e in to_index] == ["b.py", "c.py", "d.py", "e.py"]
+    assert stored == {"b.py": "hash-b"}
+    assert already == 1
+
+
+def test_nothing_pending(session, repo):
+    to_index, stored, already = repos._not_indexed(session, OWNER, repo, TREE[:1], 10)
+
+    assert (to_index, stored, already) == ([], {}, 1)
+
+
+def test_empty_tree(session, repo):
+    assert repos._not_indexed(session, OWNER, repo, [], 10) == ([], {}, 0)
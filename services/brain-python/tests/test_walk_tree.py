@@ -0,0 +1,72 @@
+import asyncio
+
+from app import repos
+
+URL = "/repos/o/n/git/trees"
+
+
+def _blob(path, sha):
+    return {"path": path, "type": "blob", "sha": sha, "size": 1}
+
+
+def _dir(path, sha):
+    return {"path": path, "type": "tree", "sha": sha}
+
+
+# A tree too big for one recursive listing: the root and big/ come back
+# truncated, src/ and big/deep/ fit in one recursive call each.
+LISTINGS = {
+    f"{URL}/root?recursive=1": {"truncated": True, "tree": [_blob("partial", "x")]},
+    f"{URL}/root": {"tree": [_blob("README.md", "r"), _dir("src", "S"), _dir("big", "B")]},
+    f"{URL}/S?recursive=1": {
+        "tree": [_blob("x.py", "sx"), _dir("sub", "SS"), _blob("sub/y.py", "sy")]
+    },
+    f"{URL}/B?recursive=1": {"truncated": True, "tree": [_blob("z.txt", "bz")]},
+    f"{URL}/B": {"tree": [_blob("z.txt", "bz"), _dir("deep", "D")]},
+    f"{URL}/D?recursive=1": {"tree": [_blob("w.md", "dw")]},
+}
+
+
+def _fake_gh_get(fetched):
+    async def gh_get(token, url):
+        fetched.append(url)
+        return LISTINGS[url]
+
+    return gh_get
+
+
+def test_walk_tree_rebuilds_a_truncated_tree(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(repos, "_gh_get", _fake_gh_get(fetched))
+
+    entries = asyncio.run(repos._walk_tree("tok", "o", "n", "root"))
+
+    assert sorted(entries) == [
+        repos.TreeEntry("README.md", "r", 1),
+        repos.TreeEntry("big/deep/w.md", "dw", 1),
+        repos.TreeEntry("big/z.txt", "bz", 1),
+        repos.TreeEntry("src/sub/y.py", "sy", 1),
+        repos.TreeEntry("src/x.py", "sx", 1),
+    ]
+    # The root is known to be truncated, so only its own level is listed;
+    # only the truncated big/ is split further.
+    assert f"{URL}/root?recursive=1" not in fetched
+    assert sorted(fetched) == sorted(u for u in LISTINGS if u != f"{URL}/root?recursive=1")
+
+
+def test_get_tree_entries_walks_when_truncated(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(repos, "_gh_get", _fake_gh_get(fetched))
+    monkeypatch.setattr(repos, "_tree_cache", type(repos._tree_cache)())
+
+    entries = asyncio.run(repos._get_tree_entries("tok", "o", "n", "root"))
+
+    assert [e.path for e in entries] == [
+        "README.md",
+        "big/deep/w.md",
+        "big/z.txt",
+        "src/sub/y.py",
+        "src/x.py",
+    ]
+    assert "partial" not in {e.path for e in entries}
+    assert fetched[0] == f"{URL}/root?recursive=1"